@@ -0,0 +1,141 @@
+"""
+Compares the recall@20 and latency of the IVF index of `IVFVectorStore` against exact search.
+
+The vectors are synthetic: normalized gaussian noise around random cluster centers, which is closer to real embeddings
+than uniform noise. Queries are drawn from the same distribution.
+
+Usage:
+    python benchmarks/ann_benchmark.py --sizes 10000,100000,1000000 --dimension 256
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Set
+
+import numpy as np
+from numpy.typing import NDArray
+
+from rebuff.embeddings import HashingEmbeddings
+from rebuff.local_vector_store import IVFVectorStore, normalize_embeddings
+
+
+def generate_vectors(
+    size: int, dimension: int, centers: NDArray[np.float64], rng: np.random.Generator
+) -> NDArray[np.float32]:
+    vectors = np.empty((size, dimension), dtype=np.float32)
+    # Generated in chunks to bound the memory used by the float64 noise
+    for start in range(0, size, 100000):
+        count = min(100000, size - start)
+        labels = rng.integers(0, centers.shape[0], count)
+        vectors[start : start + count] = normalize_embeddings(
+            centers[labels] + 0.5 * rng.normal(size=(count, dimension))
+        )
+    return vectors
+
+
+def search(
+    vector_store: IVFVectorStore, queries: NDArray[np.float32], k: int, n_probe: int = 0
+) -> Dict[str, Any]:
+    ids: List[Set[str]] = []
+    latencies: List[float] = []
+    for query in queries:
+        started = time.perf_counter()
+        [results] = vector_store.similarity_search_by_vectors_with_score(
+            [query], k, n_probe=n_probe or None
+        )
+        latencies.append(time.perf_counter() - started)
+        ids.append({document.page_content for document, _ in results})
+
+    return {
+        "ids": ids,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+    }
+
+
+def run(
+    size: int, dimension: int, n_queries: int, n_probes: List[int], k: int, seed: int
+) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(16, size // 1000), dimension))
+    # The benchmark adds and searches vectors directly, so the embeddings are never called
+    vector_store = IVFVectorStore(HashingEmbeddings(dimension))
+
+    for start in range(0, size, 100000):
+        vectors = generate_vectors(min(100000, size - start), dimension, centers, rng)
+        ids = [str(i) for i in range(start, start + len(vectors))]
+        vector_store.add_vectors(vectors, ids, [{} for _ in ids], ids)
+    queries = generate_vectors(n_queries, dimension, centers, rng)
+
+    # Searches are exact until the index is trained
+    exact = search(vector_store, queries, k)
+    rows = [
+        {
+            "size": size,
+            "search": "exact",
+            "recall": 1.0,
+            "p50_ms": exact["p50_ms"],
+            "p99_ms": exact["p99_ms"],
+        }
+    ]
+
+    started = time.perf_counter()
+    vector_store.train(seed=seed)
+    train_seconds = time.perf_counter() - started
+
+    for n_probe in n_probes:
+        approximate = search(vector_store, queries, k, n_probe)
+        recall = np.mean(
+            [
+                len(found & expected) / k
+                for found, expected in zip(approximate["ids"], exact["ids"])
+            ]
+        )
+        rows.append(
+            {
+                "size": size,
+                "search": f"ivf n_lists={len(vector_store.list_sizes)} n_probe={n_probe}",
+                "recall": float(recall),
+                "p50_ms": approximate["p50_ms"],
+                "p99_ms": approximate["p99_ms"],
+                "train_s": train_seconds,
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--n-probes", default="1,4,16,64")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    print(f"{'size':>9}  {'search':<32} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in map(int, args.sizes.split(",")):
+        for row in run(
+            size,
+            args.dimension,
+            args.queries,
+            [int(n_probe) for n_probe in args.n_probes.split(",")],
+            args.k,
+            args.seed,
+        ):
+            results.append(row)
+            print(
+                f"{row['size']:>9}  {row['search']:<32} {row['recall']:>7.3f} "
+                f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,28 @@ from rebuff._version import __version__
 
 from .rebuff import (
     ApiFailureResponse,
+    AsyncRebuff,
     DetectApiRequest,
+    DetectBatchApiRequest,
     DetectApiSuccessResponse,
     Rebuff,
 )
 
-from .sdk import RebuffSdk, RebuffDetectionResponse
+from .cache import CacheBackend, InMemoryCache, SQLiteCache
+from .canary import (
+    CanaryLeak,
+    CanaryScanner,
+    CanaryStreamMonitor,
+    MultiCanaryStreamMonitor,
+)
+from .embeddings import (
+    CachedEmbeddings,
+    DiskEmbeddingStore,
+    EmbeddingCache,
+    HashingEmbeddings,
+)
+from .heuristic_executor import HeuristicExecutor
+from .leak_logging import BackgroundLeakLogger, LeakEvent
+from .local_vector_store import IVFVectorStore, NumpyVectorStore
+from .metrics import InMemoryMetrics, MetricsHook
+from .sdk import AsyncRebuffSdk, RebuffSdk, RebuffDetectionResponse
@@ -0,0 +1,128 @@
+from collections import deque
+from typing import Dict, Hashable, Iterable, Iterator, List, Sequence, Tuple
+
+
+class AhoCorasickAutomaton:
+    """
+    Multi-pattern matcher that finds every occurrence of a set of patterns in a single pass over the input.
+
+    Patterns are sequences of hashable symbols, so the same automaton matches characters in a string or words in a
+    list of words. Matching state is a plain integer, which lets callers feed the input in pieces.
+    """
+
+    def __init__(self, patterns: Iterable[Sequence[Hashable]]) -> None:
+        self._goto: List[Dict[Hashable, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+        self.pattern_lengths: List[int] = []
+
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for symbol in pattern:
+                next_state = self._goto[state].get(symbol)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                    self._goto[state][symbol] = next_state
+                state = next_state
+            self._outputs[state].append(pattern_id)
+            self.pattern_lengths.append(len(pattern))
+
+        # Breadth-first pass so the failure state of every node is known before its children are visited
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for symbol, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and symbol not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(symbol, 0)
+                self._outputs[next_state] = (
+                    self._outputs[next_state] + self._outputs[self._fail[next_state]]
+                )
+
+    def step(self, state: int, symbol: Hashable) -> int:
+        """
+        Advance the automaton by one symbol.
+
+        Args:
+            state (int): Current state, 0 at the start of the input
+            symbol (Hashable): Next input symbol
+
+        Returns:
+            int: The new state
+        """
+        goto = self._goto
+        fail = self._fail
+        while state and symbol not in goto[state]:
+            state = fail[state]
+        return goto[state].get(symbol, 0)
+
+    def outputs(self, state: int) -> List[int]:
+        """
+        Ids of the patterns that end at the current input position.
+
+        Args:
+            state (int): Current state
+
+        Returns:
+            List[int]: Pattern ids, in order of decreasing length
+        """
+        return self._outputs[state]
+
+    def iter_matches(
+        self, symbols: Iterable[Hashable], offset: int = 0, state: int = 0
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Find every occurrence of every pattern, including overlapping ones.
+
+        Args:
+            symbols (Iterable[Hashable]): Input symbols
+            offset (int): Position of the first symbol in the whole input. Defaults to 0.
+            state (int): State to resume from. Defaults to 0.
+
+        Returns:
+            Iterator[Tuple[int, int]]: (start position, pattern id) of each match, ordered by end position
+        """
+        pattern_lengths = self.pattern_lengths
+        for position, symbol in enumerate(symbols, offset):
+            state = self.step(state, symbol)
+            for pattern_id in self._outputs[state]:
+                yield position - pattern_lengths[pattern_id] + 1, pattern_id
+
+    def find_all(
+        self, symbols: Iterable[Hashable], offset: int = 0, state: int = 0
+    ) -> Tuple[List[Tuple[int, int]], int]:
+        """
+        Same as `iter_matches`, also returning the state reached, so that the next piece of the input can resume from
+        it.
+
+        Args:
+            symbols (Iterable[Hashable]): Input symbols
+            offset (int): Position of the first symbol in the whole input. Defaults to 0.
+            state (int): State to resume from. Defaults to 0.
+
+        Returns:
+            Tuple[List[Tuple[int, int]], int]: (start position, pattern id) of each match, and the final state
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        pattern_lengths = self.pattern_lengths
+        matches: List[Tuple[int, int]] = []
+
+        # step() is inlined, this loop runs once per input symbol
+        for position, symbol in enumerate(symbols, offset):
+            while state and symbol not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(symbol, 0)
+            if outputs[state]:
+                for pattern_id in outputs[state]:
+                    matches.append(
+                        (position - pattern_lengths[pattern_id] + 1, pattern_id)
+                    )
+
+        return matches, state
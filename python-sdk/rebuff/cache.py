@@ -0,0 +1,201 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from rebuff.detect_pi_heuristics import normalize_string
+
+
+def get_cache_key(check: str, user_input: str, variant: str = "") -> str:
+    """
+    Builds the cache key of a check score.
+
+    Args:
+        check (str): Name of the check, e.g. "heuristic"
+        user_input (str): The user input, which is normalized so that equivalent inputs share a key
+        variant (str): Anything else the score depends on, e.g. the model used by the check
+
+    Returns:
+        str
+    """
+    digest = hashlib.sha256(normalize_string(user_input).encode("utf-8")).hexdigest()
+    return f"{check}:{variant}:{digest}"
+
+
+class CacheBackend(ABC):
+    """
+    Storage for check scores with hit and miss counters. Subclasses implement `_get` and `_set`.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[float]:
+        """
+        Looks up a score.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            Optional[float]: The cached score, or None if it is missing or expired
+        """
+        value = self._get(key)
+
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def set(self, key: str, value: float) -> None:
+        """
+        Stores a score.
+
+        Args:
+            key (str): Cache key
+            value (float): Score of the check
+        """
+        self._set(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: Number of cache hits and misses so far
+        """
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        """
+        Releases the resources held by the backend.
+        """
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[float]:
+        ...
+
+    @abstractmethod
+    def _set(self, key: str, value: float) -> None:
+        ...
+
+
+class InMemoryCache(CacheBackend):
+    """
+    Process-local cache with least-recently-used eviction and a time to live.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = 3600) -> None:
+        """
+        Args:
+            max_size (int): Maximum number of scores kept. Defaults to 10000.
+            ttl (Optional[float]): Seconds a score stays valid. Defaults to 3600, None never expires scores.
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: float) -> None:
+        expires_at = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache stored in a SQLite database file, which survives restarts and can be shared by the processes of a host.
+    """
+
+    def __init__(
+        self, path: str, max_size: int = 1000000, ttl: Optional[float] = 86400
+    ) -> None:
+        """
+        Args:
+            path (str): Path of the database file, created if missing
+            max_size (int): Maximum number of scores kept. Defaults to 1000000.
+            ttl (Optional[float]): Seconds a score stays valid. Defaults to 86400, None never expires scores.
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS scores "
+                "(key TEXT PRIMARY KEY, value REAL, expires_at REAL, used_at REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS scores_used_at ON scores (used_at)"
+            )
+
+    def _get(self, key: str) -> Optional[float]:
+        # Wall clock time, since entries are shared with other processes
+        now = time.time()
+
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM scores WHERE key = ? AND expires_at >= ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._connection.execute(
+                "UPDATE scores SET used_at = ? WHERE key = ?", (now, key)
+            )
+            return float(row[0])
+
+    def _set(self, key: str, value: float) -> None:
+        now = time.time()
+        expires_at = float("inf") if self.ttl is None else now + self.ttl
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+
+            # Counting rows is a full scan, so only evict once in a while
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._connection.execute(
+                    "DELETE FROM scores WHERE expires_at < ?", (now,)
+                )
+                self._connection.execute(
+                    "DELETE FROM scores WHERE key IN (SELECT key FROM scores "
+                    "ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,),
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
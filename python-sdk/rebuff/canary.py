@@ -0,0 +1,240 @@
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from pydantic import BaseModel
+
+from rebuff._aho_corasick import AhoCorasickAutomaton
+
+DEFAULT_CANARY_FORMAT = "<!-- {canary_word} -->"
+
+# Up to this many patterns, one str.find per pattern runs in C and beats a single pass of the automaton in Python
+_FIND_MAX_PATTERNS = 400
+
+
+class CanaryStreamMonitor:
+    """
+    Detects a canary word in a completion streamed chunk by chunk, so that a leaking stream can be stopped early.
+
+    Only the last `len(canary_word) - 1` characters are kept between chunks, which is enough for a canary word split
+    across chunk boundaries to be found and keeps memory independent of the completion length.
+    """
+
+    def __init__(
+        self,
+        canary_word: str,
+        on_leak: Optional[Callable[["CanaryStreamMonitor", str], None]] = None,
+    ) -> None:
+        """
+        Args:
+            canary_word (str): The canary word to look for
+            on_leak (Optional[Callable[[CanaryStreamMonitor, str], None]]): Called once, when the canary word is found,
+                with the monitor and the text around the leak (the kept characters and the chunk that completed the
+                canary word). Defaults to None.
+        """
+        if not canary_word:
+            raise ValueError("canary_word must not be empty")
+
+        self.canary_word = canary_word
+        self.on_leak = on_leak
+        self.leaked = False
+        self.leak_position: Optional[int] = None
+        self.consumed = 0
+        self._tail = ""
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Scans the next chunk of the completion.
+
+        Args:
+            chunk (str): Next piece of the completion
+
+        Returns:
+            bool: True if the canary word has leaked so far, in this chunk or an earlier one
+        """
+        if self.leaked:
+            self.consumed += len(chunk)
+            return True
+
+        text = self._tail + chunk
+        position = text.find(self.canary_word)
+        self.consumed += len(chunk)
+
+        if position >= 0:
+            self.leaked = True
+            # Position in the whole completion, the text starts with the characters kept from earlier chunks
+            self.leak_position = self.consumed - len(text) + position
+            self._tail = ""
+            if self.on_leak is not None:
+                self.on_leak(self, text)
+            return True
+
+        keep = len(self.canary_word) - 1
+        self._tail = text[-keep:] if keep else ""
+        return False
+
+
+class CanaryLeak(BaseModel):
+    canary_word: str
+    # Position of the first occurrence of the canary word in the completion
+    position: int
+    # Position of the first occurrence of the canary word in its canary format, if it leaked as added to the prompt
+    format_position: Optional[int] = None
+
+
+class CanaryScanner:
+    """
+    Finds which of a set of canary words leaked in a completion. Streamed completions, and completions checked for
+    many canary words, are scanned in a single pass with an Aho-Corasick automaton whatever the number of canary words.
+
+    Both the canary words and the canary words in their format, as `add_canary_word` embeds them in the prompt, are
+    looked for.
+    """
+
+    def __init__(
+        self,
+        canary_words: Union[Iterable[str], Dict[str, str]],
+        canary_format: str = DEFAULT_CANARY_FORMAT,
+    ) -> None:
+        """
+        Args:
+            canary_words (Union[Iterable[str], Dict[str, str]]): The canary words, or a dict from each canary word to
+                the format it was added with
+            canary_format (str): Format of the canary words not given one. Defaults to "<!-- {canary_word} -->".
+        """
+        if not isinstance(canary_words, dict):
+            canary_words = {canary_word: canary_format for canary_word in canary_words}
+        if "" in canary_words:
+            raise ValueError("canary_words must not be empty strings")
+
+        # Pattern i is the canary word, or its formatted version, of self._pattern_canary_words[i]
+        patterns: List[str] = []
+        self._pattern_canary_words: List[str] = []
+        self._pattern_is_formatted: List[bool] = []
+        for canary_word, word_format in canary_words.items():
+            formatted = word_format.format(canary_word=canary_word)
+            if canary_word not in formatted:
+                raise ValueError(
+                    f"canary format {word_format!r} doesn't contain the canary word"
+                )
+
+            for pattern, is_formatted in ((canary_word, False), (formatted, True)):
+                if is_formatted and pattern == canary_word:
+                    continue
+                patterns.append(pattern)
+                self._pattern_canary_words.append(canary_word)
+                self._pattern_is_formatted.append(is_formatted)
+
+        self.canary_words = list(canary_words)
+        self._patterns = patterns
+        self.automaton = AhoCorasickAutomaton(patterns)
+
+    def scan(self, completion: str) -> Dict[str, CanaryLeak]:
+        """
+        Args:
+            completion (str): The completion generated by the AI
+
+        Returns:
+            Dict[str, CanaryLeak]: The leak of each leaked canary word, by canary word
+        """
+        if len(self._patterns) > _FIND_MAX_PATTERNS:
+            monitor = self.monitor()
+            monitor.feed(completion)
+            return monitor.leaks
+
+        leaks: Dict[str, CanaryLeak] = {}
+        # Each canary word comes before its formatted version in the patterns
+        for pattern, canary_word, is_formatted in zip(
+            self._patterns, self._pattern_canary_words, self._pattern_is_formatted
+        ):
+            position = completion.find(pattern)
+            if position < 0:
+                continue
+            if not is_formatted:
+                leaks[canary_word] = CanaryLeak(
+                    canary_word=canary_word, position=position
+                )
+            elif canary_word in leaks:
+                leaks[canary_word].format_position = position
+        return leaks
+
+    def monitor(
+        self,
+        on_leak: Optional[
+            Callable[["MultiCanaryStreamMonitor", CanaryLeak], None]
+        ] = None,
+    ) -> "MultiCanaryStreamMonitor":
+        """
+        Args:
+            on_leak (Optional[Callable[[MultiCanaryStreamMonitor, CanaryLeak], None]]): See `MultiCanaryStreamMonitor`
+
+        Returns:
+            MultiCanaryStreamMonitor: Monitor scanning a streamed completion for the canary words
+        """
+        return MultiCanaryStreamMonitor(self, on_leak)
+
+
+class MultiCanaryStreamMonitor:
+    """
+    Detects any of the canary words of a `CanaryScanner` in a completion streamed chunk by chunk.
+
+    The matcher state carries partial matches across chunk boundaries, so no text is kept between chunks.
+    """
+
+    def __init__(
+        self,
+        scanner: CanaryScanner,
+        on_leak: Optional[
+            Callable[["MultiCanaryStreamMonitor", CanaryLeak], None]
+        ] = None,
+    ) -> None:
+        """
+        Args:
+            scanner (CanaryScanner): The canary words to look for
+            on_leak (Optional[Callable[[MultiCanaryStreamMonitor, CanaryLeak], None]]): Called once per canary word,
+                when it is first found. Defaults to None.
+        """
+        self.scanner = scanner
+        self.on_leak = on_leak
+        self.leaks: Dict[str, CanaryLeak] = {}
+        self.consumed = 0
+        self._state = 0
+
+    @property
+    def leaked(self) -> bool:
+        return bool(self.leaks)
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Scans the next chunk of the completion.
+
+        Args:
+            chunk (str): Next piece of the completion
+
+        Returns:
+            bool: True if any canary word has leaked so far, in this chunk or an earlier one
+        """
+        matches, self._state = self.scanner.automaton.find_all(
+            chunk, self.consumed, self._state
+        )
+        self.consumed += len(chunk)
+
+        new_leaks: List[CanaryLeak] = []
+        is_formatted = self.scanner._pattern_is_formatted
+        # A formatted canary word contains the canary word, which ends no later, so the canary words are handled
+        # first
+        for start, pattern_id in sorted(
+            matches, key=lambda match: is_formatted[match[1]]
+        ):
+            canary_word = self.scanner._pattern_canary_words[pattern_id]
+            leak = self.leaks.get(canary_word)
+            if leak is None:
+                leak = CanaryLeak(canary_word=canary_word, position=start)
+                self.leaks[canary_word] = leak
+                new_leaks.append(leak)
+            elif is_formatted[pattern_id] and leak.format_position is None:
+                leak.format_position = start
+
+        if self.on_leak is not None:
+            for leak in new_leaks:
+                self.on_leak(self, leak)
+
+        return self.leaked
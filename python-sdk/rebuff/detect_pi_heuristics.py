@@ -1,6 +1,14 @@
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
 from difflib import SequenceMatcher
-from typing import List
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from rebuff._aho_corasick import AhoCorasickAutomaton
 
 
 def generate_injection_keywords() -> List[str]:
@@ -109,6 +117,24 @@ def normalize_string(input_string: str) -> str:
     return normalized_string
 
 
+# Default number of words scored at once by the heuristic check
+DEFAULT_CHUNK_SIZE = 200
+
+# Characters of the raw input normalized at once when streaming its words
+_NORMALIZE_BLOCK_SIZE = 65536
+
+# Chunks scored in parallel that may be waiting at once, which bounds the memory of a parallel scan
+_MAX_PENDING_CHUNKS = 16
+
+# Default number of (input word, keyword word) pairs matched at once by the batch heuristic check
+DEFAULT_MAX_PAIRS = 1000000
+
+# Margin of the score bounds of the batch heuristic check, so that rounding never prunes the best window
+_BOUND_MARGIN = 1e-9
+
+_WHITESPACE = re.compile(r"\s")
+
+
 def get_input_substrings(normalized_input: str, keyword_length: int) -> List[str]:
     """
     Iterate over the input string and get substrings which have same length as as the keywords string
@@ -120,13 +146,48 @@ def get_input_substrings(normalized_input: str, keyword_length: int) -> List[str
     Returns:
         List of input substrings that have the same length as the number of keywords in injection string
     """
-    words_in_input_string = normalized_input.split(" ")
-    input_substrings = []
-    number_of_substrings = len(words_in_input_string) - keyword_length + 1
-    for i in range(number_of_substrings):
-        input_substrings.append(" ".join(words_in_input_string[i : i + keyword_length]))
+    return list(iter_input_substrings(normalized_input.split(" "), keyword_length))
+
+
+def iter_input_substrings(input_words: List[str], keyword_length: int) -> Iterator[str]:
+    """
+    Lazily generates the input substrings that have as many words as a keyword.
+
+    Args:
+        input_words (List[str]): Words of the normalized input string
+        keyword_length (int): The number of words in the injection string
+
+    Returns:
+        Iterator[str]: Each input substring of `keyword_length` words, in order
+    """
+    for i in range(len(input_words) - keyword_length + 1):
+        yield " ".join(input_words[i : i + keyword_length])
+
+
+def iter_normalized_words(input_string: str) -> Iterator[str]:
+    """
+    Lazily generates the words of the normalized input string, without normalizing the whole input at once.
+
+    The input is normalized in blocks cut at whitespace, so the words are the same as in
+    `normalize_string(input_string).split(" ")`, except that an empty input has no words.
+
+    Args:
+        input_string (str): String to be normalized
+
+    Returns:
+        Iterator[str]: The normalized words, in order
+    """
+    start = 0
+    while start < len(input_string):
+        end = start + _NORMALIZE_BLOCK_SIZE
+        if end < len(input_string):
+            whitespace = _WHITESPACE.search(input_string, end)
+            end = whitespace.start() if whitespace else len(input_string)
 
-    return input_substrings
+        normalized_block = normalize_string(input_string[start:end])
+        if normalized_block:
+            yield from normalized_block.split(" ")
+        start = end
 
 
 def get_matched_words_score(
@@ -136,6 +197,20 @@ def get_matched_words_score(
         [part for part, word in zip(keyword_parts, substring.split()) if word == part]
     )
 
+    return get_base_score(matched_words_count, max_matched_words)
+
+
+def get_base_score(matched_words_count: int, max_matched_words: int) -> float:
+    """
+    Score a substring by the number of words it shares, position for position, with a keyword.
+
+    Args:
+        matched_words_count (int): Number of words matching the keyword at the same position
+        max_matched_words (int): Number of matched words at which the score saturates
+
+    Returns:
+        float: 0 if no words matched, otherwise a score between 0.5 and 1.0
+    """
     if matched_words_count > 0:
         base_score = 0.5 + 0.5 * min(matched_words_count / max_matched_words, 1)
     else:
@@ -144,35 +219,556 @@ def get_matched_words_score(
     return base_score
 
 
-def detect_prompt_injection_using_heuristic_on_input(input: str) -> float:
-    highest_score = 0
-    max_matched_words = 5
+class HeuristicIndex:
+    """
+    Precomputed view of the injection keywords used by the heuristic check.
+
+    Building the index normalizes every keyword once, so repeated checks don't have to regenerate and normalize the
+    whole keyword set on every call. Instances are read-only after construction and safe to share across threads.
+
+    Attributes:
+        keywords (List[str]): Normalized keyword strings
+        keyword_parts (List[List[str]]): Words of each normalized keyword, aligned with `keywords`
+        length_buckets (Dict[int, List[int]]): Keyword ids grouped by their number of words
+        postings (Dict[str, List[Tuple[int, int]]]): Inverted index from a word to the (keyword id, word position)
+            pairs it occurs at
+        automaton (AhoCorasickAutomaton): Word-level matcher over `keyword_parts`, used to find keywords that occur
+            verbatim in the normalized input
+        word_ids (Dict[str, int]): Id of each keyword word, from 1, for the batch check. Other words have id 0.
+        posting_offsets (np.ndarray): `postings` of the word with id i, in `posting_keyword_ids` and
+            `posting_positions`, are between offsets i and i + 1
+        posting_keyword_ids (np.ndarray): Keyword id of each posting
+        posting_positions (np.ndarray): Word position of each posting
+        keyword_lengths (np.ndarray): Number of words of each keyword
+        keyword_string_lengths (np.ndarray): Number of characters of each normalized keyword
+    """
+
+    def __init__(self, injection_keywords: List[str]) -> None:
+        self.keywords: List[str] = []
+        self.keyword_parts: List[List[str]] = []
+        self.length_buckets: Dict[int, List[int]] = {}
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+
+        for keyword_string in injection_keywords:
+            normalized_keyword_string = normalize_string(keyword_string)
+            keywords = normalized_keyword_string.split(" ")
+
+            keyword_id = len(self.keywords)
+            self.keywords.append(normalized_keyword_string)
+            self.keyword_parts.append(keywords)
+            self.length_buckets.setdefault(len(keywords), []).append(keyword_id)
+
+            for position, word in enumerate(keywords):
+                self.postings.setdefault(word, []).append((keyword_id, position))
+
+        self.automaton = AhoCorasickAutomaton(self.keyword_parts)
+
+        # The postings flattened into arrays, for the batch check to match many words at once
+        self.word_ids = {word: i + 1 for i, word in enumerate(self.postings)}
+        word_postings: List[List[Tuple[int, int]]] = [[]] + list(self.postings.values())
+        self.posting_offsets = np.cumsum(
+            [0] + [len(postings) for postings in word_postings], dtype=np.int64
+        )
+        self.posting_keyword_ids = np.array(
+            [keyword_id for postings in word_postings for keyword_id, _ in postings],
+            dtype=np.int64,
+        )
+        self.posting_positions = np.array(
+            [position for postings in word_postings for _, position in postings],
+            dtype=np.int64,
+        )
+        self.keyword_lengths = np.array(
+            [len(keywords) for keywords in self.keyword_parts], dtype=np.int64
+        )
+        self.keyword_string_lengths = np.array(
+            [len(keyword) for keyword in self.keywords], dtype=np.int64
+        )
+
+
+_heuristic_index: Optional[HeuristicIndex] = None
+_heuristic_index_lock = threading.Lock()
+
+
+def get_heuristic_index() -> HeuristicIndex:
+    """
+    Returns the shared heuristic index for the default injection keywords, building it on first use.
 
-    all_injection_keywords_strings = generate_injection_keywords()
-    normalized_input_string = normalize_string(input)
+    Returns:
+        HeuristicIndex
+    """
+    global _heuristic_index
 
-    for keyword_string in all_injection_keywords_strings:
-        normalized_keyword_string = normalize_string(keyword_string)
-        keywords = normalized_keyword_string.split(" ")
-        # Generate substrings of similar length (to keyword length) in the input string
-        input_substrings = get_input_substrings(normalized_input_string, len(keywords))
+    if _heuristic_index is None:
+        with _heuristic_index_lock:
+            if _heuristic_index is None:
+                _heuristic_index = HeuristicIndex(generate_injection_keywords())
 
-        # Calculate the similarity score between the keywords and each substring
-        for substring in input_substrings:
-            similarity_score = SequenceMatcher(
-                None, substring, normalized_keyword_string
-            ).ratio()
+    return _heuristic_index
+
+
+def _find_candidate_windows(
+    input_words: List[str], index: HeuristicIndex
+) -> Dict[Tuple[int, int], List[int]]:
+    """
+    Find the (keyword, input window) pairs that share at least one word at the same position.
 
-            matched_word_score = get_matched_words_score(
-                substring, keywords, max_matched_words
+    Pairs without a positional word match have a base score of 0 and can never raise the highest score, so they
+    are never materialized.
+
+    Args:
+        input_words (List[str]): Words of the normalized input string
+        index (HeuristicIndex): Keyword index to match against
+
+    Returns:
+        Dict[Tuple[int, int], List[int]]: Maps (keyword id, window start) to [matched words count, length of the
+            longest matched word]
+    """
+    candidates: Dict[Tuple[int, int], List[int]] = {}
+    number_of_words = len(input_words)
+
+    for position, word in enumerate(input_words):
+        for keyword_id, keyword_position in index.postings.get(word, ()):
+            start = position - keyword_position
+            if (
+                start < 0
+                or start + len(index.keyword_parts[keyword_id]) > number_of_words
+            ):
+                continue
+
+            candidate = candidates.get((keyword_id, start))
+            if candidate is None:
+                candidates[(keyword_id, start)] = [1, len(word)]
+            else:
+                candidate[0] += 1
+                candidate[1] = max(candidate[1], len(word))
+
+    return candidates
+
+
+def _score_input_words(
+    input_words: List[str],
+    index: HeuristicIndex,
+    max_matched_words: int,
+    highest_score: float = 0,
+    work: Optional[List[int]] = None,
+) -> float:
+    """
+    Compute the highest adjusted score of the input words, only scoring windows that can still beat the best score.
+
+    The adjusted score of a window is its base score minus a similarity penalty of at most 1 / (2 * max_matched_words).
+    Windows are visited by decreasing base score, so once a base score can't beat the best score the remaining
+    windows are skipped. The similarity ratio is at least 2 * M / T, where M is the length of the longest matched
+    word and T the total length of both strings, which lets windows be discarded before running SequenceMatcher.
+
+    Args:
+        input_words (List[str]): Words of the normalized input string
+        index (HeuristicIndex): Keyword index to score against
+        max_matched_words (int): Number of matched words at which the base score saturates
+        highest_score (float): Score to beat. Defaults to 0.
+        work (Optional[List[int]]): If given, its only item is increased by the number of candidate windows.
+            Defaults to None.
+
+    Returns:
+        float: The highest adjusted score, or `highest_score` if no window beats it
+    """
+    penalty = 1 / (max_matched_words * 2)
+
+    # Fast path: a keyword that occurs verbatim matches all of its words and has a similarity ratio of exactly 1.0,
+    # so its score is known without running SequenceMatcher. Seeding the best score with it lets the fuzzy pass
+    # below skip every window that can't beat an exact match.
+    for _, keyword_id in index.automaton.iter_matches(input_words):
+        base_score = get_base_score(
+            len(index.keyword_parts[keyword_id]), max_matched_words
+        )
+        adjusted_score = base_score - 1.0 * penalty
+
+        if adjusted_score > highest_score:
+            highest_score = adjusted_score
+
+    candidates = _find_candidate_windows(input_words, index)
+    if work is not None:
+        work[0] += len(candidates)
+
+    groups: Dict[float, List[Tuple[int, int, int]]] = {}
+    for (keyword_id, start), (count, longest) in candidates.items():
+        base_score = get_base_score(count, max_matched_words)
+        groups.setdefault(base_score, []).append((keyword_id, start, longest))
+
+    for base_score in sorted(groups, reverse=True):
+        if base_score <= highest_score:
+            break
+
+        matcher = None
+        matcher_keyword_id = -1
+        scored_substrings = set()
+        for keyword_id, start, longest in sorted(groups[base_score]):
+            normalized_keyword_string = index.keywords[keyword_id]
+            keyword_length = len(index.keyword_parts[keyword_id])
+            substring = " ".join(input_words[start : start + keyword_length])
+
+            # Repeated passages produce the same (keyword, substring) pair, which always scores the same
+            if (keyword_id, substring) in scored_substrings:
+                continue
+            scored_substrings.add((keyword_id, substring))
+
+            # Early exit: even the smallest possible similarity penalty can't beat the current best
+            lower_bound = (
+                2.0 * longest / (len(substring) + len(normalized_keyword_string))
             )
+            if base_score - lower_bound * penalty <= highest_score:
+                continue
+
+            # SequenceMatcher caches its analysis of the second sequence, so reuse it per keyword
+            if matcher is None or matcher_keyword_id != keyword_id:
+                matcher = SequenceMatcher(None, "", normalized_keyword_string)
+                matcher_keyword_id = keyword_id
+            matcher.set_seq1(substring)
+            similarity_score = matcher.ratio()
 
             # Adjust the score using the similarity score
-            adjusted_score = matched_word_score - similarity_score * (
-                1 / (max_matched_words * 2)
-            )
+            adjusted_score = base_score - similarity_score * penalty
 
             if adjusted_score > highest_score:
                 highest_score = adjusted_score
 
     return highest_score
+
+
+def _iter_chunks(
+    words: Iterator[str], chunk_size: int, overlap: int
+) -> Iterator[List[str]]:
+    """
+    Groups the words in chunks of `chunk_size` words, each starting with the last `overlap` words of the previous one.
+
+    Args:
+        words (Iterator[str]): Words of the normalized input string
+        chunk_size (int): Number of words per chunk, more than `overlap`
+        overlap (int): Number of words shared by consecutive chunks
+
+    Returns:
+        Iterator[List[str]]: The chunks, the last one possibly shorter
+    """
+    chunk: List[str] = []
+    has_new_words = False
+    for word in words:
+        chunk.append(word)
+        has_new_words = True
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = chunk[len(chunk) - overlap :] if overlap else []
+            has_new_words = False
+
+    # The words left over are already in the previous chunk unless some came after it
+    if has_new_words:
+        yield chunk
+
+
+def _score_chunk(
+    input_words: List[str], index: Optional[HeuristicIndex] = None
+) -> Tuple[float, int]:
+    """
+    Scores a chunk on its own, e.g. in a worker process, which then uses its own copy of the shared index.
+
+    Args:
+        input_words (List[str]): Words of the chunk
+        index (Optional[HeuristicIndex]): Keyword index to score against. Defaults to the shared index.
+
+    Returns:
+        Tuple[float, int]: The highest adjusted score of the chunk and the number of candidate windows it had
+    """
+    work = [0]
+    score = _score_input_words(
+        input_words, index or get_heuristic_index(), 5, work=work
+    )
+    return score, work[0]
+
+
+def detect_prompt_injection_using_heuristic_on_input(
+    input: str,
+    index: Optional[HeuristicIndex] = None,
+    timings: Optional[Dict[str, float]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_work: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> float:
+    """
+    Detects prompt injection by comparing the user input with known injection phrases.
+
+    Every input substring with as many words as a keyword is scored by the number of words it shares with the
+    keyword at the same position, minus a penalty proportional to their SequenceMatcher similarity ratio.
+
+    The input is streamed in chunks of `chunk_size` words overlapping by one word less than the longest keyword, so
+    every substring lies within a chunk and memory doesn't grow with the input length.
+
+    Args:
+        input (str): User input to be checked for prompt injection
+        index (Optional[HeuristicIndex]): Keyword index to score against. Defaults to the shared index.
+        timings (Optional[Dict[str, float]]): If given, the seconds spent normalizing the input ("normalize") and
+            scoring it ("heuristic") are stored in it. Defaults to None.
+        chunk_size (int): Number of words scored at once. Defaults to 200.
+        max_work (Optional[int]): Number of candidate windows, i.e. input substrings sharing a word with a keyword,
+            after which no further chunk is scored. The score of the scanned part is returned, so the score of a
+            longer input can be lower than without a budget. Defaults to None (no budget).
+        executor (Optional[Executor]): Executor to score the chunks in parallel, e.g. a `ProcessPoolExecutor` for
+            very large inputs. Defaults to None, which scores them in the calling thread.
+
+    Returns:
+        float: The highest adjusted score over all keywords and input substrings
+    """
+    max_matched_words = 5
+
+    if index is None:
+        index = get_heuristic_index()
+
+    overlap = max(index.length_buckets, default=1) - 1
+    if chunk_size <= overlap:
+        raise ValueError(
+            f"chunk_size must be more than {overlap} words, but was {chunk_size}"
+        )
+
+    chunks = _iter_chunks(iter_normalized_words(input), chunk_size, overlap)
+    normalize_seconds = 0.0
+    started = time.perf_counter()
+
+    score: float = 0
+    if executor is not None:
+        score = _score_chunks_in_parallel(chunks, index, max_work, executor)
+    else:
+        work = [0]
+        while max_work is None or work[0] < max_work:
+            chunk_started = time.perf_counter()
+            chunk = next(chunks, None)
+            normalize_seconds += time.perf_counter() - chunk_started
+            if chunk is None:
+                break
+            score = _score_input_words(
+                chunk, index, max_matched_words, score, work=work
+            )
+
+    if timings is not None:
+        timings["normalize"] = normalize_seconds
+        timings["heuristic"] = time.perf_counter() - started - normalize_seconds
+    return score
+
+
+def _score_chunks_in_parallel(
+    chunks: Iterator[List[str]],
+    index: HeuristicIndex,
+    max_work: Optional[int],
+    executor: Executor,
+) -> float:
+    # Worker processes score against their own shared index rather than receiving a copy of it with every chunk
+    chunk_index = None if index is _heuristic_index else index
+
+    score: float = 0
+    work = 0
+    pending: Deque["Future[Tuple[float, int]]"] = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(_score_chunk, chunk, chunk_index))
+            if len(pending) < _MAX_PENDING_CHUNKS:
+                continue
+
+            chunk_score, chunk_work = pending.popleft().result()
+            score, work = max(score, chunk_score), work + chunk_work
+            if max_work is not None and work >= max_work:
+                break
+
+        while pending:
+            chunk_score, chunk_work = pending.popleft().result()
+            score = max(score, chunk_score)
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return score
+
+
+def detect_prompt_injection_using_heuristic_on_inputs(
+    inputs: List[str],
+    index: Optional[HeuristicIndex] = None,
+    max_pairs: int = DEFAULT_MAX_PAIRS,
+) -> List[float]:
+    """
+    Detects prompt injection in many user inputs, with the same scores as
+    `detect_prompt_injection_using_heuristic_on_input` at a fraction of the cost per input.
+
+    The words of many inputs are mapped to keyword word ids, and the matched word count of every (input substring,
+    keyword) pair sharing a word is computed at once with array operations. SequenceMatcher then only runs on the
+    pairs whose score bound can still beat the best score of their input, from the highest bound down.
+
+    Args:
+        inputs (List[str]): User inputs to be checked for prompt injection
+        index (Optional[HeuristicIndex]): Keyword index to score against. Defaults to the shared index.
+        max_pairs (int): Number of (input word, keyword word) pairs matched at once, which bounds the memory used.
+            Defaults to 1000000.
+
+    Returns:
+        List[float]: The highest adjusted score of each input, in order
+    """
+    if index is None:
+        index = get_heuristic_index()
+
+    scores: List[float] = [0] * len(inputs)
+    # SequenceMatcher ratios by (keyword id, substring), as corpora often repeat passages
+    ratios: Dict[Tuple[int, str], float] = {}
+    overlap = max(index.length_buckets, default=1) - 1
+    posting_counts = np.diff(index.posting_offsets)
+
+    batch_inputs: List[int] = []
+    batch_chunks: List[List[str]] = []
+    batch_word_ids: List[int] = []
+    batch_pairs = 0
+    for input_id, input in enumerate(inputs):
+        for chunk in _iter_chunks(
+            iter_normalized_words(input), DEFAULT_CHUNK_SIZE, overlap
+        ):
+            chunk_word_ids = [index.word_ids.get(word, 0) for word in chunk]
+            batch_inputs.append(input_id)
+            batch_chunks.append(chunk)
+            batch_word_ids.extend(chunk_word_ids)
+            batch_pairs += int(posting_counts[chunk_word_ids].sum())
+            if batch_pairs >= max_pairs:
+                _score_chunk_batch(
+                    batch_chunks, batch_inputs, batch_word_ids, index, scores, ratios
+                )
+                batch_inputs, batch_chunks, batch_word_ids = [], [], []
+                batch_pairs = 0
+
+    if batch_chunks:
+        _score_chunk_batch(
+            batch_chunks, batch_inputs, batch_word_ids, index, scores, ratios
+        )
+
+    return scores
+
+
+def _score_chunk_batch(
+    chunks: List[List[str]],
+    chunk_input_ids: List[int],
+    chunk_word_ids: List[int],
+    index: HeuristicIndex,
+    scores: List[float],
+    ratios: Dict[Tuple[int, str], float],
+) -> None:
+    """
+    Raises the score of each input to the highest adjusted score of its chunks in the batch.
+
+    Args:
+        chunks (List[List[str]]): Words of each chunk
+        chunk_input_ids (List[int]): Input of each chunk
+        chunk_word_ids (List[int]): Keyword word id of each word of the chunks, one after the other
+        index (HeuristicIndex): Keyword index to score against
+        scores (List[float]): Score of each input, updated in place
+        ratios (Dict[Tuple[int, str], float]): SequenceMatcher ratios already computed, updated in place
+    """
+    max_matched_words = 5
+    penalty = 1 / (max_matched_words * 2)
+    # The base score only depends on the matched word count, which is at most the longest keyword length
+    base_scores_by_count = [
+        get_base_score(count, max_matched_words)
+        for count in range(max(index.length_buckets, default=0) + 1)
+    ]
+
+    words = [word for chunk in chunks for word in chunk]
+    word_ids = np.array(chunk_word_ids, dtype=np.int64)
+    word_lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    # Characters before each word, so that the length of a substring is a difference
+    characters_before = np.concatenate(([0], np.cumsum(word_lengths)))
+
+    chunk_ends = np.cumsum([len(chunk) for chunk in chunks])
+    chunk_starts = chunk_ends - [len(chunk) for chunk in chunks]
+    word_chunks = np.repeat(np.arange(len(chunks)), [len(chunk) for chunk in chunks])
+
+    # One pair per (input word, posting of the word): the keyword word it matches and the substring it falls in
+    keyword_words = np.flatnonzero(word_ids)
+    first_postings = index.posting_offsets[word_ids[keyword_words]]
+    posting_counts = index.posting_offsets[word_ids[keyword_words] + 1] - first_postings
+    pair_words = np.repeat(keyword_words, posting_counts)
+    pair_postings = (
+        np.arange(len(pair_words))
+        - np.repeat(np.cumsum(posting_counts) - posting_counts, posting_counts)
+        + np.repeat(first_postings, posting_counts)
+    )
+    pair_keyword_ids = index.posting_keyword_ids[pair_postings]
+    pair_starts = pair_words - index.posting_positions[pair_postings]
+
+    # Substrings must lie within the chunk, the overlap between chunks has the others
+    pair_chunks = word_chunks[pair_words]
+    inside = (pair_starts >= chunk_starts[pair_chunks]) & (
+        pair_starts + index.keyword_lengths[pair_keyword_ids] <= chunk_ends[pair_chunks]
+    )
+    pair_words, pair_keyword_ids, pair_starts, pair_chunks = (
+        pair_words[inside],
+        pair_keyword_ids[inside],
+        pair_starts[inside],
+        pair_chunks[inside],
+    )
+    if not len(pair_words):
+        return
+
+    # The pairs of a (substring, keyword) candidate are adjacent once sorted, so they can be counted and reduced
+    candidate_keys = pair_starts * len(index.keywords) + pair_keyword_ids
+    order = np.argsort(candidate_keys, kind="stable")
+    candidate_keys = candidate_keys[order]
+    first_pairs = np.flatnonzero(np.diff(candidate_keys, prepend=-1))
+    counts = np.diff(np.append(first_pairs, len(candidate_keys)))
+    longest = np.maximum.reduceat(word_lengths[pair_words[order]], first_pairs)
+
+    starts = pair_starts[order][first_pairs]
+    keyword_ids = pair_keyword_ids[order][first_pairs]
+    input_ids = np.asarray(chunk_input_ids)[pair_chunks[order][first_pairs]]
+    lengths = index.keyword_lengths[keyword_ids]
+    substring_lengths = (
+        characters_before[starts + lengths] - characters_before[starts] + lengths - 1
+    )
+
+    base_scores = 0.5 + 0.5 * np.minimum(counts / max_matched_words, 1)
+    total_lengths = substring_lengths + index.keyword_string_lengths[keyword_ids]
+    # The similarity ratio is at least 2 * M / T (see `_score_input_words`), which bounds the adjusted score from
+    # above, and at most 2 * min(len(a), len(b)) / T, which bounds it from below
+    upper_bounds = base_scores - 2.0 * longest / total_lengths * penalty
+    lower_bounds = (
+        base_scores
+        - 2.0
+        * np.minimum(substring_lengths, index.keyword_string_lengths[keyword_ids])
+        / total_lengths
+        * penalty
+    )
+
+    # A keyword occurring verbatim has a similarity ratio of exactly 1.0, so its score is known without
+    # SequenceMatcher
+    exact = counts == lengths
+    for input_id, count in zip(input_ids[exact].tolist(), counts[exact].tolist()):
+        adjusted_score = base_scores_by_count[count] - 1.0 * penalty
+        if adjusted_score > scores[input_id]:
+            scores[input_id] = adjusted_score
+
+    # Only candidates that may beat the score some candidate of their input is sure to reach are refined, from the
+    # highest bound down
+    floors = np.asarray(scores, dtype=np.float64)
+    np.maximum.at(floors, input_ids, lower_bounds)
+    refine = ~exact & (upper_bounds + _BOUND_MARGIN > floors[input_ids])
+    order = np.lexsort((-upper_bounds[refine], input_ids[refine]))
+    keyword_lengths = index.keyword_lengths.tolist()
+    for input_id, upper_bound, start, keyword_id, count in zip(
+        input_ids[refine][order].tolist(),
+        upper_bounds[refine][order].tolist(),
+        starts[refine][order].tolist(),
+        keyword_ids[refine][order].tolist(),
+        counts[refine][order].tolist(),
+    ):
+        if upper_bound + _BOUND_MARGIN <= scores[input_id]:
+            continue
+
+        substring = " ".join(words[start : start + keyword_lengths[keyword_id]])
+        similarity_score = ratios.get((keyword_id, substring))
+        if similarity_score is None:
+            similarity_score = SequenceMatcher(
+                None, substring, index.keywords[keyword_id]
+            ).ratio()
+            ratios[(keyword_id, substring)] = similarity_score
+
+        adjusted_score = base_scores_by_count[count] - similarity_score * penalty
+        if adjusted_score > scores[input_id]:
+            scores[input_id] = adjusted_score
@@ -1,6 +1,11 @@
-from typing import Dict
+import threading
+from typing import Any, Dict, Optional, Tuple
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+_openai_clients: Dict[Tuple[str, Optional[str]], OpenAI] = {}
+_openai_clients_lock = threading.Lock()
 
 
 def render_prompt_for_pi_detection(user_input: str) -> str:
@@ -52,8 +57,107 @@ def render_prompt_for_pi_detection(user_input: str) -> str:
     """
 
 
+def create_openai_client(
+    api_key: str,
+    base_url: Optional[str] = None,
+    max_connections: int = 20,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 30.0,
+) -> OpenAI:
+    """
+    Creates an Open AI client backed by its own connection pool.
+
+    Args:
+        api_key (str): Open AI API key
+        base_url (Optional[str]): Open AI API base url. Defaults to the Open AI API.
+        max_connections (int): Maximum number of open connections. Defaults to 20.
+        max_keepalive_connections (int): Maximum number of idle connections kept open. Defaults to 10.
+        keepalive_expiry (float): Seconds an idle connection is kept open. Defaults to 30.
+        timeout (float): Request timeout in seconds. Defaults to 30.
+
+    Returns:
+        OpenAI
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+    )
+
+    return OpenAI(
+        api_key=api_key, base_url=base_url, timeout=timeout, http_client=http_client
+    )
+
+
+def create_async_openai_client(
+    api_key: str,
+    base_url: Optional[str] = None,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 30.0,
+) -> AsyncOpenAI:
+    """
+    Creates an asyncio Open AI client backed by its own connection pool.
+
+    Args:
+        api_key (str): Open AI API key
+        base_url (Optional[str]): Open AI API base url. Defaults to the Open AI API.
+        max_connections (int): Maximum number of open connections. Defaults to 100.
+        max_keepalive_connections (int): Maximum number of idle connections kept open. Defaults to 20.
+        keepalive_expiry (float): Seconds an idle connection is kept open. Defaults to 30.
+        timeout (float): Request timeout in seconds. Defaults to 30.
+
+    Returns:
+        AsyncOpenAI
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+    )
+
+    return AsyncOpenAI(
+        api_key=api_key, base_url=base_url, timeout=timeout, http_client=http_client
+    )
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    """
+    Returns a shared Open AI client for the API key and base url, creating it on first use.
+
+    Args:
+        api_key (str): Open AI API key
+        base_url (Optional[str]): Open AI API base url. Defaults to the Open AI API.
+
+    Returns:
+        OpenAI
+    """
+    key = (api_key, base_url)
+
+    client = _openai_clients.get(key)
+    if client is None:
+        with _openai_clients_lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                client = create_openai_client(api_key, base_url)
+                _openai_clients[key] = client
+
+    return client
+
+
 def call_openai_to_detect_pi(
-    prompt_to_detect_pi_using_openai: str, model: str, api_key: str
+    prompt_to_detect_pi_using_openai: str,
+    model: str,
+    api_key: str,
+    client: Optional[OpenAI] = None,
 ) -> Dict:
     """
     Using Open AI to detect prompt injection in the user input
@@ -62,18 +166,47 @@ def call_openai_to_detect_pi(
         prompt_to_detect_pi_using_openai (str): The user input which has been rendered in a format to generate a score for whether Open AI thinks the input has prompt injection or not.
         model (str):
         api_key (str):
+        client (Optional[OpenAI]): Client to send the request with. Defaults to the shared client for `api_key`.
 
     Returns:
         Dict (str, float): The likelihood score that Open AI assign to user input for containing prompt injection
 
     """
-    client = OpenAI(api_key=api_key)
+    if client is None:
+        client = get_openai_client(api_key)
 
     completion = client.chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt_to_detect_pi_using_openai}],
     )
 
+    return _get_completion_response(completion)
+
+
+async def acall_openai_to_detect_pi(
+    prompt_to_detect_pi_using_openai: str, model: str, client: AsyncOpenAI
+) -> Dict[str, str]:
+    """
+    Using Open AI to detect prompt injection in the user input, without blocking the event loop
+
+    Args:
+        prompt_to_detect_pi_using_openai (str): The user input which has been rendered in a format to generate a score for whether Open AI thinks the input has prompt injection or not.
+        model (str):
+        client (AsyncOpenAI): Client to send the request with
+
+    Returns:
+        Dict (str, float): The likelihood score that Open AI assign to user input for containing prompt injection
+
+    """
+    completion = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt_to_detect_pi_using_openai}],
+    )
+
+    return _get_completion_response(completion)
+
+
+def _get_completion_response(completion: Any) -> Dict[str, str]:
     if completion.choices[0].message.content is None:
         raise Exception("server error")
 
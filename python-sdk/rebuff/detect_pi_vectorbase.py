@@ -1,21 +1,34 @@
-from typing import Dict
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import pinecone
 from langchain.vectorstores.pinecone import Pinecone
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import OpenAIEmbeddings
 
+from rebuff.embeddings import CachedEmbeddings, EmbeddingCache
+from rebuff.local_vector_store import NumpyVectorStore
+
 
 # https://api.python.langchain.com/en/latest/vectorstores/langchain.vectorstores.pinecone.Pinecone.html
 def detect_pi_using_vector_database(
-    input: str, similarity_threshold: float, vector_store: Pinecone
-) -> Dict:
+    input: str,
+    similarity_threshold: float,
+    vector_store: VectorStore,
+    timings: Optional[Dict[str, float]] = None,
+) -> Dict[str, float]:
     """
     Detects Prompt Injection using similarity search with vector database.
 
     Args:
         input (str): user input to be checked for prompt injection
         similarity_threshold (float): The threshold for similarity between entries in vector database and the user input.
-        vector_store (Pinecone): Vector database of prompt injections
+        vector_store (VectorStore): Vector database of prompt injections, e.g. Pinecone or NumpyVectorStore
+        timings (Optional[Dict[str, float]]): If given, the seconds spent embedding the input ("embed") and querying
+            the vector database ("vector_query") are stored in it. Defaults to None.
 
     Returns:
         Dict (str, Union[float, int]): top_score (float) that contains the highest score wrt similarity between vector database and the user input.
@@ -24,9 +37,131 @@ def detect_pi_using_vector_database(
     """
 
     top_k = 20
-    results = vector_store.similarity_search_with_score(input, top_k)
+    started = time.perf_counter()
+    embedded = started
+
+    # Embedding the input here, as the vector store would, tells the embedding time from the query time
+    embeddings = vector_store.embeddings
+    search_by_vector = _get_search_by_vector(vector_store)
+    if embeddings is not None and search_by_vector is not None:
+        embedding = embeddings.embed_query(input)
+        embedded = time.perf_counter()
+        results = search_by_vector(embedding, k=top_k)
+        if timings is not None:
+            timings["embed"] = embedded - started
+    else:
+        results = vector_store.similarity_search_with_score(input, top_k)
+
+    if timings is not None:
+        timings["vector_query"] = time.perf_counter() - embedded
+
+    return get_vector_score(results, similarity_threshold)
+
+
+async def adetect_pi_using_vector_database(
+    input: str, similarity_threshold: float, vector_store: VectorStore
+) -> Dict[str, float]:
+    """
+    Detects Prompt Injection using similarity search with vector database, without blocking the event loop.
+
+    Args:
+        input (str): user input to be checked for prompt injection
+        similarity_threshold (float): The threshold for similarity between entries in vector database and the user input.
+        vector_store (VectorStore): Vector database of prompt injections, e.g. Pinecone or NumpyVectorStore
 
-    top_score = 0
+    Returns:
+        Dict (str, Union[float, int]): Same as `detect_pi_using_vector_database`
+    """
+
+    top_k = 20
+    results = await vector_store.asimilarity_search_with_score(input, top_k)
+
+    return get_vector_score(results, similarity_threshold)
+
+
+def detect_pi_using_vector_database_many(
+    inputs: List[str],
+    similarity_threshold: float,
+    vector_store: VectorStore,
+    batch_size: int = 500,
+    executor: Optional[Executor] = None,
+) -> List[Dict[str, float]]:
+    """
+    Detects Prompt Injection in many inputs, embedding them in batches and querying the vector database concurrently.
+
+    Args:
+        inputs (List[str]): user inputs to be checked for prompt injection
+        similarity_threshold (float): The threshold for similarity between entries in vector database and the user input.
+        vector_store (VectorStore): Vector database of prompt injections, e.g. Pinecone or NumpyVectorStore
+        batch_size (int): Number of inputs embedded per embedding request. Defaults to 500.
+        executor (Optional[Executor]): Executor the vector database queries run on. Defaults to running them one
+            after another.
+
+    Returns:
+        List[Dict (str, Union[float, int])]: The vector score of each input, in input order. See
+            `detect_pi_using_vector_database`.
+    """
+
+    top_k = 20
+
+    embeddings = vector_store.embeddings
+    search_by_vector = _get_search_by_vector(vector_store)
+    if embeddings is None or search_by_vector is None:
+        # The store can only embed and search each input itself
+        def query_text(input: str) -> Dict[str, float]:
+            results = vector_store.similarity_search_with_score(input, top_k)
+            return get_vector_score(results, similarity_threshold)
+
+        if executor is None:
+            return list(map(query_text, inputs))
+        return list(executor.map(query_text, inputs))
+
+    def query(embedding: List[float]) -> Dict[str, float]:
+        results = search_by_vector(embedding, k=top_k)
+        return get_vector_score(results, similarity_threshold)
+
+    vector_scores: List[Dict[str, float]] = []
+    for start in range(0, len(inputs), batch_size):
+        batch_embeddings = embeddings.embed_documents(
+            inputs[start : start + batch_size]
+        )
+        if isinstance(vector_store, NumpyVectorStore):
+            # A local store searches the whole batch with one matrix product
+            vector_scores.extend(
+                get_vector_score(results, similarity_threshold)
+                for results in vector_store.similarity_search_by_vectors_with_score(
+                    batch_embeddings, k=top_k
+                )
+            )
+        elif executor is None:
+            vector_scores.extend(map(query, batch_embeddings))
+        else:
+            vector_scores.extend(executor.map(query, batch_embeddings))
+
+    return vector_scores
+
+
+def _get_search_by_vector(
+    vector_store: VectorStore,
+) -> Optional[Callable[..., List[Tuple[Document, float]]]]:
+    # Pinecone and the local stores search by embedding, but it isn't part of the VectorStore interface
+    return getattr(vector_store, "similarity_search_by_vector_with_score", None)
+
+
+def get_vector_score(
+    results: List[Tuple[Any, float]], similarity_threshold: float
+) -> Dict[str, float]:
+    """
+    Summarizes the results of a similarity search into the vector score.
+
+    Args:
+        results (List[Tuple[Any, float]]): (document, similarity score) pairs returned by the vector database
+        similarity_threshold (float): The threshold for similarity between entries in vector database and the user input.
+
+    Returns:
+        Dict (str, Union[float, int]): Same as `detect_pi_using_vector_database`
+    """
+    top_score = 0.0
     count_over_max_vector_score = 0
 
     for _, score in results:
@@ -47,7 +182,13 @@ def detect_pi_using_vector_database(
     return vector_score
 
 
-def init_pinecone(api_key: str, index: str, openai_api_key: str) -> Pinecone:
+def init_pinecone(
+    api_key: str,
+    index: str,
+    openai_api_key: str,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    embeddings: Optional[Embeddings] = None,
+) -> Pinecone:
     """
     Initializes connection with the Pinecone vector database using existing (rebuff) index.
 
@@ -55,6 +196,9 @@ def init_pinecone(api_key: str, index: str, openai_api_key: str) -> Pinecone:
         api_key (str): Pinecone API key
         index (str): Pinecone index name
         openai_api_key (str): Open AI API key
+        embedding_cache (Optional[EmbeddingCache]): Cache looked up before embedding a text. Defaults to None.
+        embeddings (Optional[Embeddings]): Embeddings of the index, which must be the ones it was filled with.
+            Defaults to the Open AI "text-embedding-ada-002" embeddings.
 
     Returns:
         vector_store (Pinecone)
@@ -66,10 +210,39 @@ def init_pinecone(api_key: str, index: str, openai_api_key: str) -> Pinecone:
     pc = pinecone.Pinecone(api_key=api_key)
     pc_index = pc.Index(index)
 
-    openai_embeddings = OpenAIEmbeddings(
-        openai_api_key=openai_api_key, model="text-embedding-ada-002"
-    )
+    if embeddings is None:
+        embedding_model = "text-embedding-ada-002"
+        embeddings = OpenAIEmbeddings(
+            openai_api_key=openai_api_key, model=embedding_model
+        )
+    else:
+        embedding_model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    if embedding_cache is not None:
+        embeddings = CachedEmbeddings(
+            embeddings, embedding_cache, namespace=embedding_model
+        )
 
-    vector_store = Pinecone(pc_index, openai_embeddings, text_key="input")
+    vector_store = Pinecone(pc_index, embeddings, text_key="input")
 
     return vector_store
+
+
+def close_pinecone(vector_store: VectorStore) -> None:
+    """
+    Releases the connections held by a vector store created with `init_pinecone`.
+
+    Args:
+        vector_store (VectorStore): Vector store returned by `init_pinecone`
+    """
+    # Neither langchain wrapper exposes a close method, so release the Pinecone index and the OpenAI client directly
+    pc_index = getattr(vector_store, "_index", None)
+    if pc_index is not None and hasattr(pc_index, "__exit__"):
+        pc_index.__exit__(None, None, None)
+
+    embeddings = getattr(vector_store, "_embedding", None)
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.embeddings
+    embeddings_client = getattr(getattr(embeddings, "client", None), "_client", None)
+    if embeddings_client is not None and hasattr(embeddings_client, "close"):
+        embeddings_client.close()
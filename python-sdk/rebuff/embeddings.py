@@ -0,0 +1,370 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from numpy.typing import NDArray
+
+
+class DiskEmbeddingStore:
+    """
+    Append-only embedding store on disk, made of a float32 matrix read through a memory map and an index from content
+    hash to matrix row.
+
+    The directory holds `vectors.f32` (raw float32 rows), `index.tsv` (one "key<TAB>row" line per embedding) and
+    `meta.json` (the embedding dimension). Only one process should write to a store at a time.
+
+    A row is written before its index line. If a write is interrupted, the unindexed bytes are dropped when the store
+    is opened and before the next row is appended, so that every row stays at the offset its index line points to.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Directory of the store, created if missing
+        """
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._index_path = os.path.join(path, "index.tsv")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[NDArray[np.float32]] = None
+        self.dimension: Optional[int] = None
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as meta_file:
+                self.dimension = json.load(meta_file)["dimension"]
+
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "rb") as index_file:
+                lines = index_file.read().split(b"\n")
+            # The last line is empty, unless a crash cut it short
+            for line in lines[:-1]:
+                key, row = line.decode("utf-8").split("\t")
+                self._rows[key] = int(row)
+            if lines[-1]:
+                os.truncate(self._index_path, sum(len(line) + 1 for line in lines[:-1]))
+
+        if self.dimension is not None and os.path.exists(self._vectors_path):
+            # Drops what an interrupted write may have left after the last indexed row
+            size = len(self._rows) * self.dimension * 4
+            if os.path.getsize(self._vectors_path) > size:
+                os.truncate(self._vectors_path, size)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, key: str) -> Optional[NDArray[np.float32]]:
+        """
+        Args:
+            key (str): Content hash of the embedded text
+
+        Returns:
+            Optional[NDArray[np.float32]]: The embedding, or None if the store doesn't have it
+        """
+        with self._lock:
+            row = self._rows.get(key)
+            # Without meta.json, the rows can't be read back
+            if row is None or self.dimension is None:
+                return None
+
+            # Rows appended since the file was mapped are not visible yet, so remap
+            vectors = self._vectors
+            if vectors is None or row >= vectors.shape[0]:
+                vectors = self._vectors = np.memmap(
+                    self._vectors_path, dtype=np.float32, mode="r"
+                ).reshape(-1, self.dimension)
+
+            return np.array(vectors[row])
+
+    def put(self, key: str, embedding: NDArray[np.float32]) -> None:
+        """
+        Args:
+            key (str): Content hash of the embedded text
+            embedding (NDArray[np.float32]): The embedding
+        """
+        with self._lock:
+            if key in self._rows:
+                return
+
+            if self.dimension is None:
+                self.dimension = int(embedding.shape[0])
+                with open(self._meta_path, "w") as meta_file:
+                    json.dump({"dimension": self.dimension}, meta_file)
+
+            row = len(self._rows)
+            with open(self._vectors_path, "ab") as vectors_file:
+                vectors_file.truncate(row * self.dimension * 4)
+                vectors_file.write(np.asarray(embedding, dtype=np.float32).tobytes())
+            # The index line is written last, so a crash never indexes a partially written row
+            with open(self._index_path, "a") as index_file:
+                index_file.write(f"{key}\t{row}\n")
+            self._rows[key] = row
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed on content hash: a bounded in-memory LRU tier in front of an optional persistent
+    `DiskEmbeddingStore`.
+    """
+
+    def __init__(self, max_size: int = 10000, path: Optional[str] = None) -> None:
+        """
+        Args:
+            max_size (int): Maximum number of embeddings kept in memory. Defaults to 10000.
+            path (Optional[str]): Directory of the on-disk tier. Defaults to None (memory only).
+        """
+        self.max_size = max_size
+        self.disk_store = DiskEmbeddingStore(path) if path is not None else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, NDArray[np.float32]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(text: str, namespace: str = "") -> str:
+        """
+        Args:
+            text (str): Embedded text
+            namespace (str): Identifies the embedding model, so that models don't share entries
+
+        Returns:
+            str: Content hash of the text
+        """
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[NDArray[np.float32]]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        if self.disk_store is not None:
+            embedding = self.disk_store.get(key)
+            if embedding is not None:
+                self._put_in_memory(key, embedding)
+                with self._lock:
+                    self.hits += 1
+                return embedding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, embedding: NDArray[np.float32]) -> None:
+        self._put_in_memory(key, embedding)
+        if self.disk_store is not None:
+            self.disk_store.put(key, embedding)
+
+    def _put_in_memory(self, key: str, embedding: NDArray[np.float32]) -> None:
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings that look texts up in an `EmbeddingCache` and only send the misses to the wrapped embeddings.
+
+    Documents and queries share cache entries, which holds for symmetric models such as the Open AI embeddings.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, cache: EmbeddingCache, namespace: str = ""
+    ) -> None:
+        """
+        Args:
+            embeddings (Embeddings): Embeddings to cache
+            cache (EmbeddingCache): Cache to use
+            namespace (str): Identifies the embedding model, so that models don't share entries
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = namespace
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.get_key(text, self.namespace) for text in texts]
+        embeddings = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, values in zip(missing, computed):
+                embedding = np.asarray(values, dtype=np.float32)
+                self.cache.put(keys[i], embedding)
+                embeddings[i] = embedding
+
+        # Every embedding is set by now
+        return [embedding.tolist() for embedding in embeddings if embedding is not None]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = EmbeddingCache.get_key(text, self.namespace)
+
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self.cache.put(key, embedding)
+
+        values: List[float] = embedding.tolist()
+        return values
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local, CPU only embeddings hashing the character n-grams of a text into a fixed number of dimensions.
+
+    Each n-gram adds 1 + log(count) to the dimension its hash selects, with a sign also taken from the hash so that
+    collisions cancel out on average, optionally weighted by the inverse document frequency learned with `fit`. The
+    embeddings are normalized. They capture lexical rather than semantic similarity, which suits known attack
+    phrasings, and take microseconds per text with no network call.
+
+    Vectors from these embeddings are not comparable with vectors from another model, so a vector store must be filled
+    and queried with the same provider.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 1024,
+        ngram_range: Tuple[int, int] = (3, 5),
+        idf: Optional[NDArray[np.float32]] = None,
+    ) -> None:
+        """
+        Args:
+            dimension (int): Size of the embeddings. Defaults to 1024.
+            ngram_range (Tuple[int, int]): Smallest and largest n-gram length, in characters. Defaults to (3, 5).
+            idf (Optional[NDArray[np.float32]]): Weight of each dimension, e.g. from a previous `fit`. Defaults to None (no
+                weighting).
+        """
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+        self.idf = idf
+
+    @property
+    def model(self) -> str:
+        """
+        Returns:
+            str: Identifies the settings and the fitted weights, which change the embeddings, e.g. for cache keys
+        """
+        model = f"hashing-{self.ngram_range[0]}-{self.ngram_range[1]}-{self.dimension}"
+        if self.idf is None:
+            return model
+        weights = hashlib.sha256(np.asarray(self.idf, dtype=np.float32).tobytes())
+        return f"{model}-idf-{weights.hexdigest()[:16]}"
+
+    def fit(self, texts: List[str]) -> "HashingEmbeddings":
+        """
+        Learns the inverse document frequency weight of each dimension.
+
+        Args:
+            texts (List[str]): Representative texts, e.g. the attack corpus
+
+        Returns:
+            HashingEmbeddings: self
+        """
+        rows, buckets, _ = self._hash_ngrams(texts)
+        document_frequency: NDArray[np.int64] = np.zeros(self.dimension, dtype=np.int64)
+        if len(rows):
+            present = np.unique(rows.astype(np.int64) * self.dimension + buckets)
+            document_frequency = np.bincount(
+                present % self.dimension, minlength=self.dimension
+            )
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(
+            np.float32
+        )
+        return self
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings: List[List[float]] = self.embed(texts).tolist()
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding: List[float] = self.embed([text])[0].tolist()
+        return embedding
+
+    def embed(self, texts: List[str]) -> NDArray[np.float32]:
+        """
+        Embeds a batch of texts in one pass over their characters.
+
+        Args:
+            texts (List[str]): Texts to embed
+
+        Returns:
+            NDArray[np.float32]: Matrix of normalized embeddings, one row per text
+        """
+        rows, buckets, signs = self._hash_ngrams(texts)
+
+        # Counting (text, bucket, sign) triples gives the term frequency of every hashed n-gram
+        keys, counts = np.unique(
+            (rows.astype(np.int64) * self.dimension + buckets) * 2 + (signs > 0),
+            return_counts=True,
+        )
+        cells = keys // 2
+        weights = (1 + np.log(counts)) * np.where(keys % 2 == 1, 1.0, -1.0)
+
+        # Weighted bincount already sums in float64, the cast only tells the type checker so and doesn't copy
+        matrix = (
+            np.bincount(cells, weights=weights, minlength=len(texts) * self.dimension)
+            .reshape(len(texts), self.dimension)
+            .astype(np.float64, copy=False)
+        )
+        if self.idf is not None:
+            matrix *= self.idf
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        embeddings: NDArray[np.float32] = (matrix / norms).astype(np.float32)
+        return embeddings
+
+    def _hash_ngrams(
+        self, texts: List[str]
+    ) -> Tuple[NDArray[np.int64], NDArray[np.int64], NDArray[np.int64]]:
+        # All the texts are joined, so the n-grams of the whole batch are hashed with a few array operations
+        padded = [" " + " ".join(text.lower().split()) + " " for text in texts]
+        codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32)
+        lengths = np.array([len(text) for text in padded], dtype=np.int64)
+        text_ids = np.repeat(np.arange(len(texts)), lengths)
+        ends = np.cumsum(lengths)
+
+        rows, hashes = [], []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            count = len(codes) - n + 1
+            if count <= 0:
+                continue
+
+            starts = np.arange(count)
+            # An n-gram belongs to a text only if it ends before the next text starts
+            inside = starts + n <= ends[text_ids[:count]]
+
+            ngram_hashes = np.full(count, n, dtype=np.uint64)
+            for offset in range(n):
+                ngram_hashes = ngram_hashes * np.uint64(1000003) + codes[
+                    offset : offset + count
+                ].astype(np.uint64)
+
+            rows.append(text_ids[:count][inside])
+            hashes.append(ngram_hashes[inside])
+
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        mixed = np.concatenate(hashes)
+        # splitmix64 finalizer, so that similar n-grams land in unrelated buckets
+        mixed ^= mixed >> np.uint64(30)
+        mixed *= np.uint64(0xBF58476D1CE4E5B9)
+        mixed ^= mixed >> np.uint64(27)
+        mixed *= np.uint64(0x94D049BB133111EB)
+        mixed ^= mixed >> np.uint64(31)
+
+        buckets = (mixed % np.uint64(self.dimension)).astype(np.int64)
+        signs = np.where(mixed >> np.uint64(63), 1, -1)
+        return np.concatenate(rows), buckets, signs
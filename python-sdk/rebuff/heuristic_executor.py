@@ -0,0 +1,115 @@
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from multiprocessing.context import BaseContext
+from types import TracebackType
+from typing import Iterable, Iterator, Optional, Type
+
+from rebuff.detect_pi_heuristics import (
+    detect_prompt_injection_using_heuristic_on_input,
+    get_heuristic_index,
+)
+
+
+def _initialize_worker() -> None:
+    # The keyword index is built once per worker, rather than on its first check
+    get_heuristic_index()
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+def _check(user_input: str, max_work: Optional[int]) -> float:
+    return detect_prompt_injection_using_heuristic_on_input(
+        user_input, max_work=max_work
+    )
+
+
+class HeuristicExecutor:
+    """
+    Runs the heuristic check in a pool of worker processes, so that checks from many threads run in parallel instead
+    of taking turns on the GIL.
+
+    The workers are started, and build their keyword index, when the executor is created, so the first checks don't
+    pay for it. Checks use the default injection keywords.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        mp_context: Optional[BaseContext] = None,
+    ) -> None:
+        """
+        Args:
+            processes (Optional[int]): Number of worker processes. Defaults to the number of CPUs.
+            mp_context (Optional[BaseContext]): Multiprocessing context the workers are started with, e.g.
+                `multiprocessing.get_context("spawn")`. Defaults to the platform default.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=mp_context,
+            initializer=_initialize_worker,
+        )
+
+        # A worker is started for each task submitted while the others are busy, so this starts all of them
+        wait([self.executor.submit(_warm_up) for _ in range(self.processes)])
+
+    def submit(
+        self, user_input: str, max_work: Optional[int] = None
+    ) -> "Future[float]":
+        """
+        Schedules the heuristic check of a user input.
+
+        Args:
+            user_input (str): User input to be checked for prompt injection
+            max_work (Optional[int]): Budget of the check, see `detect_prompt_injection_using_heuristic_on_input`.
+                Defaults to None (no budget).
+
+        Returns:
+            Future[float]: The heuristic score, once computed
+        """
+        return self.executor.submit(_check, user_input, max_work)
+
+    def map(
+        self,
+        user_inputs: Iterable[str],
+        max_work: Optional[int] = None,
+        chunksize: int = 1,
+    ) -> Iterator[float]:
+        """
+        Runs the heuristic check of many user inputs.
+
+        Args:
+            user_inputs (Iterable[str]): User inputs to be checked for prompt injection
+            max_work (Optional[int]): Budget of each check. Defaults to None (no budget).
+            chunksize (int): Number of inputs sent to a worker at once, larger values save inter-process
+                communication on many short inputs. Defaults to 1.
+
+        Returns:
+            Iterator[float]: The heuristic scores, in the order of `user_inputs`
+        """
+        user_inputs = list(user_inputs)
+        return self.executor.map(
+            _check, user_inputs, [max_work] * len(user_inputs), chunksize=chunksize
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the worker processes.
+
+        Args:
+            wait (bool): Whether to wait for the worker processes to exit. Defaults to True.
+        """
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self) -> "HeuristicExecutor":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.shutdown()
@@ -0,0 +1,184 @@
+import atexit
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class LeakEvent(BaseModel):
+    user_input: str
+    completion: str
+    canary_word: str
+
+
+# Markers put in the queue next to the events
+_FLUSH = object()
+_STOP = object()
+
+
+class BackgroundLeakLogger:
+    """
+    Logs canary word leaks from a background thread, so that detecting a leak doesn't wait on the write.
+
+    Events are queued and written in batches, once `batch_size` events are waiting or `flush_interval` seconds after
+    the first event of a batch. The queue is bounded: when it is full, new events are dropped and counted rather than
+    slowing down the caller. Pending events are written when the logger is closed, including at interpreter exit, and
+    events logged after that are dropped.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+    ) -> None:
+        """
+        Args:
+            batch_size (int): Maximum number of events written at once. Defaults to 100.
+            flush_interval (float): Maximum number of seconds an event waits for its batch to fill. Defaults to 1.0.
+            max_queue_size (int): Maximum number of events waiting to be written. Defaults to 10000.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.last_error: Optional[BaseException] = None
+        self._queue: "queue.Queue[object]" = queue.Queue(max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._write: Optional[Callable[[List[LeakEvent]], None]] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "logged": 0,
+            "dropped": 0,
+            "failed": 0,
+            "batches": 0,
+            "max_queued": 0,
+        }
+
+    def start(self, write: Callable[[List[LeakEvent]], None]) -> None:
+        """
+        Starts the background thread. The SDK clients call it with their own writer.
+
+        Args:
+            write (Callable[[List[LeakEvent]], None]): Writes a batch of events, e.g. to the vector store
+        """
+        if self._thread is not None:
+            raise RuntimeError("BackgroundLeakLogger is already started")
+
+        self._write = write
+        self._thread = threading.Thread(
+            target=self._run, name="rebuff-leak-logger", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, event: LeakEvent) -> bool:
+        """
+        Queues an event without blocking.
+
+        Args:
+            event (LeakEvent): The leak to log
+
+        Returns:
+            bool: False if the queue was full or the logger closed, and the event was dropped
+        """
+        # Under the lock, so that no event is queued after the stop marker, where nothing would write it
+        with self._stats_lock:
+            if self._closed:
+                self._stats["dropped"] += 1
+                return False
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self._stats["dropped"] += 1
+                return False
+
+            self._stats["max_queued"] = max(
+                self._stats["max_queued"], self._queue.qsize()
+            )
+        return True
+
+    def flush(self) -> None:
+        """
+        Blocks until every event queued so far is written.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self) -> None:
+        """
+        Writes the pending events and stops the background thread.
+        """
+        with self._stats_lock:
+            self._closed = True
+        if self._thread is None:
+            return
+
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        atexit.unregister(self.close)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: Number of events waiting ("queued"), written ("logged"), dropped because the queue was full
+                or the logger closed ("dropped") and lost to a failed write ("failed"), number of writes ("batches") and
+                the most events ever waiting at once ("max_queued")
+        """
+        with self._stats_lock:
+            return {"queued": self._queue.qsize(), **self._stats}
+
+    def _run(self) -> None:
+        batch: List[LeakEvent] = []
+        deadline: Optional[float] = None
+
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # The oldest event of the batch has waited long enough
+                self._write_batch(batch)
+                batch, deadline = [], None
+                continue
+
+            if isinstance(item, LeakEvent):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+
+            self._write_batch(batch)
+            batch, deadline = [], None
+
+            if not isinstance(item, LeakEvent):
+                self._queue.task_done()
+            if item is _STOP:
+                return
+
+    def _write_batch(self, batch: List[LeakEvent]) -> None:
+        if not batch:
+            return
+
+        try:
+            self._write(batch)  # type: ignore[misc]
+        except Exception as error:
+            # The caller has moved on, so the error is kept for inspection rather than raised
+            self.last_error = error
+            with self._stats_lock:
+                self._stats["failed"] += len(batch)
+        else:
+            with self._stats_lock:
+                self._stats["logged"] += len(batch)
+        finally:
+            with self._stats_lock:
+                self._stats["batches"] += 1
+            for _ in batch:
+                self._queue.task_done()
@@ -0,0 +1,621 @@
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from numpy.typing import NDArray
+
+
+def normalize_embeddings(embeddings: Any) -> NDArray[np.float32]:
+    """
+    Scales embeddings to unit length, so that their dot product is their cosine similarity.
+
+    Args:
+        embeddings (Any): One embedding per row
+
+    Returns:
+        NDArray[np.float32]: Matrix of the normalized embeddings. Zero embeddings are left as is.
+    """
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    normalized: NDArray[np.float32] = matrix / norms
+    return normalized
+
+
+def top_k_scores(
+    scores: NDArray[Any], k: int
+) -> Tuple[NDArray[np.int64], NDArray[Any]]:
+    """
+    Selects the k highest scores of each row without sorting the whole row.
+
+    Args:
+        scores (NDArray[Any]): Similarity scores, one row per query
+        k (int): Number of scores to select
+
+    Returns:
+        Tuple[NDArray[np.int64], NDArray[Any]]: Column indices and scores of the selected entries, in order of
+            decreasing score
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+
+    if k < scores.shape[1]:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(k), (scores.shape[0], k))
+    selected = np.take_along_axis(scores, indices, axis=1)
+
+    order = np.argsort(-selected, axis=1, kind="stable")
+    return (
+        np.take_along_axis(indices, order, axis=1),
+        np.take_along_axis(selected, order, axis=1),
+    )
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store doing exact cosine similarity search over a contiguous float32 matrix, a drop-in
+    replacement for the Pinecone vector store when the attack corpus fits on one host.
+
+    With a path, the store lives in a directory holding `vectors.f32` (raw float32 rows of the normalized embeddings),
+    `documents.jsonl` (one {"id", "text", "metadata"} line per row) and `meta.json` (the embedding dimension). The
+    vectors are memory-mapped rather than read, and added texts are appended to the files. Only one process should
+    write to a store at a time.
+
+    Vectors are written before their documents. If a write is interrupted, the rows missing either part are dropped
+    when the store is opened, and any partial write is cut off before the next append, so that the files stay aligned.
+    """
+
+    def __init__(self, embedding: Embeddings, path: Optional[str] = None) -> None:
+        """
+        Args:
+            embedding (Embeddings): Embeddings of the stored texts and of the queries
+            path (Optional[str]): Directory of the store, created if missing. Defaults to None (memory only).
+        """
+        self._embedding = embedding
+        self.path = path
+        self.dimension: Optional[int] = None
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        # Rows past the size are spare capacity, so that appends don't copy the matrix every time
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        # Bytes of documents.jsonl holding the documents of the rows
+        self._documents_size = 0
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load(path)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """
+        Embeds texts and appends them to the store.
+
+        Args:
+            texts (Iterable[str]): Texts to add
+            metadatas (Optional[List[Dict[str, Any]]]): Metadata of each text. Defaults to empty metadata.
+            ids (Optional[List[str]]): Id of each text. Defaults to random ids.
+
+        Returns:
+            List[str]: Ids of the added texts
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = normalize_embeddings(self._embedding.embed_documents(texts))
+
+        self.add_vectors(vectors, texts, metadatas, ids)
+        return ids
+
+    def add_vectors(
+        self,
+        vectors: NDArray[np.float32],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+    ) -> None:
+        """
+        Appends already normalized embeddings to the store.
+
+        Args:
+            vectors (NDArray[np.float32]): Normalized embeddings, one row per text
+            texts (List[str]): Embedded texts
+            metadatas (List[Dict[str, Any]]): Metadata of each text
+            ids (List[str]): Id of each text
+        """
+        with self._lock:
+            self._add_vectors(vectors, texts, metadatas, ids)
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score(query, k, **kwargs)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Args:
+            query (str): Text to look for
+            k (int): Number of results. Defaults to 4.
+
+        Returns:
+            List[Tuple[Document, float]]: The k most similar texts and their cosine similarity to the query
+        """
+        return self.similarity_search_by_vector_with_score(
+            self._embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Args:
+            embedding (List[float]): Embedding to look for
+            k (int): Number of results. Defaults to 4.
+
+        Returns:
+            List[Tuple[Document, float]]: The k most similar texts and their cosine similarity to the embedding
+        """
+        return self.similarity_search_by_vectors_with_score([embedding], k, **kwargs)[0]
+
+    def similarity_search_by_vectors_with_score(
+        self, embeddings: List[List[float]], k: int = 4, **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Searches for many embeddings at once with a single matrix product.
+
+        Args:
+            embeddings (List[List[float]]): Embeddings to look for
+            k (int): Number of results per embedding. Defaults to 4.
+
+        Returns:
+            List[List[Tuple[Document, float]]]: The results of each embedding, see
+                `similarity_search_by_vector_with_score`
+        """
+        vectors, size = self._snapshot()
+        if size == 0:
+            return [[] for _ in embeddings]
+
+        queries = normalize_embeddings(embeddings)
+        indices, scores = top_k_scores(queries @ vectors.T, k)
+        return [
+            [(self._get_document(int(i)), float(score)) for i, score in zip(*row)]
+            for row in zip(indices, scores)
+        ]
+
+    @classmethod
+    def from_texts(
+        cls: Type["NumpyVectorStore"],
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        path: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        vector_store = cls(embedding, path=path)
+        vector_store.add_texts(texts, metadatas, **kwargs)
+        return vector_store
+
+    def _get_document(self, row: int) -> Document:
+        return Document(page_content=self._texts[row], metadata=self._metadatas[row])
+
+    def _add_vectors(
+        self,
+        vectors: NDArray[np.float32],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+    ) -> None:
+        if self.dimension is None:
+            self.dimension = int(vectors.shape[1])
+            if self.path is not None:
+                with open(os.path.join(self.path, "meta.json"), "w") as meta_file:
+                    json.dump({"dimension": self.dimension}, meta_file)
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(
+                f"Embeddings have dimension {vectors.shape[1]}, but the store has dimension {self.dimension}"
+            )
+
+        if self.path is not None:
+            self._append_to_files(self.path, vectors, texts, metadatas, ids)
+        else:
+            self._append_in_memory(vectors)
+
+        self._ids.extend(ids)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        self._size += len(texts)
+
+    def _snapshot(self) -> Tuple[NDArray[np.float32], int]:
+        with self._lock:
+            if (
+                self.path is not None
+                and self.dimension is not None
+                and self._vectors.shape[0] < self._size
+            ):
+                # Rows appended since the file was mapped are not visible yet, so remap
+                self._vectors = _map_vectors(self.path, self.dimension, self._size)
+            return self._vectors[: self._size], self._size
+
+    def _append_in_memory(self, vectors: NDArray[np.float32]) -> None:
+        size = self._size + vectors.shape[0]
+        if size > self._vectors.shape[0]:
+            grown = np.empty(
+                (max(size, 2 * self._vectors.shape[0]), vectors.shape[1]),
+                dtype=np.float32,
+            )
+            if self._size:
+                grown[: self._size] = self._vectors[: self._size]
+            # Searches in progress keep using the previous matrix, which is never written again
+            self._vectors = grown
+        self._vectors[self._size : size] = vectors
+
+    def _append_to_files(
+        self,
+        path: str,
+        vectors: NDArray[np.float32],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+    ) -> None:
+        documents = b"".join(
+            json.dumps({"id": id, "text": text, "metadata": metadata}).encode("utf-8")
+            + b"\n"
+            for id, text, metadata in zip(ids, texts, metadatas)
+        )
+
+        # Both files are cut back to the last complete row first, in case an earlier append was interrupted
+        with open(os.path.join(path, "vectors.f32"), "ab") as vectors_file:
+            vectors_file.truncate(self._size * vectors.shape[1] * 4)
+            vectors_file.write(np.ascontiguousarray(vectors).tobytes())
+        # The documents are written last, so a crash never adds a row without its vector
+        with open(os.path.join(path, "documents.jsonl"), "ab") as documents_file:
+            documents_file.truncate(self._documents_size)
+            documents_file.write(documents)
+        self._documents_size += len(documents)
+
+    def _load(self, path: str) -> None:
+        meta_path = os.path.join(path, "meta.json")
+        documents_path = os.path.join(path, "documents.jsonl")
+        if not os.path.exists(meta_path) or not os.path.exists(documents_path):
+            return
+
+        with open(meta_path) as meta_file:
+            dimension: int = json.load(meta_file)["dimension"]
+        self.dimension = dimension
+
+        with open(documents_path, "rb") as documents_file:
+            # The last line is empty, unless a crash cut it short
+            lines = documents_file.read().split(b"\n")[:-1]
+
+        # A crash while appending can leave vectors without documents, or part of a row, which are dropped
+        vectors_path = os.path.join(path, "vectors.f32")
+        rows = (
+            os.path.getsize(vectors_path) // (4 * dimension)
+            if os.path.exists(vectors_path)
+            else 0
+        )
+        self._size = min(len(lines), rows)
+        self._documents_size = sum(len(line) + 1 for line in lines[: self._size])
+        os.truncate(documents_path, self._documents_size)
+        if os.path.exists(vectors_path):
+            os.truncate(vectors_path, self._size * dimension * 4)
+
+        for line in lines[: self._size]:
+            document = json.loads(line)
+            self._ids.append(document["id"])
+            self._texts.append(document["text"])
+            self._metadatas.append(document["metadata"])
+
+        self._vectors = _map_vectors(path, dimension, self._size)
+
+
+def _map_vectors(path: str, dimension: int, rows: int) -> NDArray[np.float32]:
+    if rows == 0:
+        # An empty file can't be mapped
+        return np.empty((0, dimension), dtype=np.float32)
+    return np.memmap(
+        os.path.join(path, "vectors.f32"),
+        dtype=np.float32,
+        mode="r",
+        shape=(rows, dimension),
+    )
+
+
+def _replace_file(path: str, array: NDArray[Any]) -> None:
+    # Written next to the target and renamed over it, so that readers and crashes never see a partial file
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        array.tofile(temporary_path)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _assign_to_centroids(
+    vectors: NDArray[np.float32], centroids: NDArray[np.float32], batch_size: int = 4096
+) -> NDArray[np.int32]:
+    # Batched, so that the score matrix stays small whatever the number of vectors
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], batch_size):
+        batch = np.asarray(vectors[start : start + batch_size])
+        assignments[start : start + batch_size] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+def _group_rows(
+    assignments: NDArray[np.int32], n_lists: int
+) -> List[NDArray[np.int64]]:
+    order = np.argsort(assignments, kind="stable")
+    bounds = np.cumsum(np.bincount(assignments, minlength=n_lists))[:-1]
+    return np.split(order.astype(np.int64), bounds)
+
+
+def train_centroids(
+    vectors: NDArray[np.float32], n_lists: int, iterations: int = 10, seed: int = 0
+) -> NDArray[np.float32]:
+    """
+    Clusters normalized embeddings with spherical k-means.
+
+    Args:
+        vectors (np.ndarray): Normalized embeddings, one per row
+        n_lists (int): Number of clusters
+        iterations (int): Number of k-means iterations. Defaults to 10.
+        seed (int): Seed of the initial centroid selection. Defaults to 0.
+
+    Returns:
+        np.ndarray: Normalized centroids, one per row
+    """
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, vectors.shape[0])
+    centroids = np.array(
+        vectors[np.sort(rng.choice(vectors.shape[0], n_lists, replace=False))]
+    )
+
+    for _ in range(iterations):
+        assignments = _assign_to_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_lists)
+        filled = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        # Empty clusters keep their previous centroid
+        centroids[filled] = normalize_embeddings(
+            np.add.reduceat(np.asarray(vectors)[order], starts, axis=0)
+        )
+
+    return centroids
+
+
+class IVFVectorStore(NumpyVectorStore):
+    """
+    `NumpyVectorStore` with an inverted file index for approximate search, for attack corpora too large to scan on
+    every check.
+
+    `train` clusters the stored embeddings, and a search then only scans the `n_probe` clusters closest to the query:
+    more probes give a better recall for a higher latency. Until the index is trained searches are exact. Texts added
+    after training join their closest cluster; retrain once the corpus has grown a lot, so that the clusters stay
+    balanced.
+
+    With a path, the centroids and the cluster of each row are stored in `ivf_centroids.f32` and
+    `ivf_assignments.i32` next to the vectors. Loading the store maps the vectors and only reads the centroids and the
+    4 byte cluster id of each row, so no clustering happens at load time. Training replaces both files atomically.
+    """
+
+    def __init__(
+        self, embedding: Embeddings, path: Optional[str] = None, n_probe: int = 8
+    ) -> None:
+        """
+        Args:
+            embedding (Embeddings): Embeddings of the stored texts and of the queries
+            path (Optional[str]): Directory of the store, created if missing. Defaults to None (memory only).
+            n_probe (int): Number of clusters scanned per search. Defaults to 8.
+        """
+        self.n_probe = n_probe
+        self.centroids: Optional[NDArray[np.float32]] = None
+        self._lists: List[NDArray[np.int64]] = []
+        super().__init__(embedding, path=path)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def list_sizes(self) -> List[int]:
+        """
+        Returns:
+            List[int]: Number of rows in each cluster, empty until the index is trained
+        """
+        return [len(rows) for rows in self._lists]
+
+    def train(
+        self,
+        n_lists: Optional[int] = None,
+        iterations: int = 10,
+        max_training_size: Optional[int] = None,
+        seed: int = 0,
+    ) -> None:
+        """
+        Clusters the stored embeddings and indexes every row in its cluster.
+
+        Args:
+            n_lists (Optional[int]): Number of clusters. Defaults to the square root of the number of rows.
+            iterations (int): Number of k-means iterations. Defaults to 10.
+            max_training_size (Optional[int]): Number of rows sampled to train the clusters. Defaults to 64 rows
+                per cluster.
+            seed (int): Seed of the sampling and of the initial centroids. Defaults to 0.
+        """
+        vectors, size = self._snapshot()
+        if size == 0:
+            raise ValueError("Cannot train the index of an empty store")
+
+        n_lists = n_lists or max(1, int(np.sqrt(size)))
+        max_training_size = max_training_size or 64 * n_lists
+        rng = np.random.default_rng(seed)
+        sample = (
+            vectors
+            if size <= max_training_size
+            else vectors[np.sort(rng.choice(size, max_training_size, replace=False))]
+        )
+
+        centroids = train_centroids(sample, n_lists, iterations, seed)
+        assignments = _assign_to_centroids(vectors, centroids)
+
+        while True:
+            # Rows added while training are assigned with the new centroids
+            vectors, current_size = self._snapshot()
+            if current_size > size:
+                assignments = np.concatenate(
+                    (
+                        assignments,
+                        _assign_to_centroids(vectors[size:current_size], centroids),
+                    )
+                )
+                size = current_size
+
+            with self._lock:
+                if self._size == size:
+                    if self.path is not None:
+                        _replace_file(
+                            os.path.join(self.path, "ivf_centroids.f32"), centroids
+                        )
+                        _replace_file(
+                            os.path.join(self.path, "ivf_assignments.i32"), assignments
+                        )
+                    self.centroids = centroids
+                    self._lists = _group_rows(assignments, centroids.shape[0])
+                    return
+
+    def add_vectors(
+        self,
+        vectors: NDArray[np.float32],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+    ) -> None:
+        with self._lock:
+            super()._add_vectors(vectors, texts, metadatas, ids)
+            if self.centroids is None:
+                return
+
+            start = self._size - vectors.shape[0]
+            assignments = _assign_to_centroids(vectors, self.centroids)
+            if self.path is not None:
+                with open(
+                    os.path.join(self.path, "ivf_assignments.i32"), "ab"
+                ) as assignments_file:
+                    # Cut back to the rows before this append, in case an earlier append was interrupted
+                    assignments_file.truncate(start * 4)
+                    assignments_file.write(assignments.tobytes())
+            # Lists are replaced rather than extended, so that searches in progress see a consistent index
+            lists = list(self._lists)
+            for list_id in np.unique(assignments):
+                rows = start + np.flatnonzero(assignments == list_id)
+                lists[list_id] = np.concatenate((lists[list_id], rows))
+            self._lists = lists
+
+    def similarity_search_by_vectors_with_score(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        n_probe: Optional[int] = None,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Searches the clusters closest to each embedding, or the whole store if the index isn't trained.
+
+        Args:
+            embeddings (List[List[float]]): Embeddings to look for
+            k (int): Number of results per embedding. Defaults to 4.
+            n_probe (Optional[int]): Number of clusters scanned. Defaults to the `n_probe` of the store.
+
+        Returns:
+            List[List[Tuple[Document, float]]]: The results of each embedding, see
+                `similarity_search_by_vector_with_score`
+        """
+        with self._lock:
+            centroids = self.centroids
+            lists = self._lists
+        if centroids is None:
+            return super().similarity_search_by_vectors_with_score(embeddings, k)
+
+        # The lists are read first, so they never reference rows past the snapshot
+        vectors, size = self._snapshot()
+        queries = normalize_embeddings(embeddings)
+        probed, _ = top_k_scores(queries @ centroids.T, n_probe or self.n_probe)
+
+        results: List[List[Tuple[Document, float]]] = []
+        for query, list_ids in zip(queries, probed):
+            rows = np.concatenate([lists[list_id] for list_id in list_ids])
+            indices, scores = top_k_scores((vectors[rows] @ query)[np.newaxis], k)
+            results.append(
+                [
+                    (self._get_document(int(rows[i])), float(score))
+                    for i, score in zip(indices[0], scores[0])
+                ]
+            )
+        return results
+
+    def _load(self, path: str) -> None:
+        super()._load(path)
+
+        centroids_path = os.path.join(path, "ivf_centroids.f32")
+        assignments_path = os.path.join(path, "ivf_assignments.i32")
+        if (
+            self._size == 0
+            or self.dimension is None
+            or not os.path.exists(centroids_path)
+        ):
+            return
+
+        # Read rather than mapped, as training replaces the file
+        self.centroids = np.fromfile(centroids_path, dtype=np.float32).reshape(
+            -1, self.dimension
+        )
+        # A crash after training can lose the assignments file, whose rows are then assigned again
+        stored = (
+            np.fromfile(assignments_path, dtype=np.int32)
+            if os.path.exists(assignments_path)
+            else np.empty(0, dtype=np.int32)
+        )
+        assignments = stored[: self._size]
+        if assignments.shape[0] < self._size:
+            # A crash between appending the vectors and their assignments leaves rows unindexed
+            missing = _assign_to_centroids(
+                self._vectors[assignments.shape[0] : self._size], self.centroids
+            )
+            assignments = np.concatenate((assignments, missing))
+        if stored.shape[0] != self._size:
+            # Also drops the assignments of rows the store dropped when loading
+            _replace_file(assignments_path, assignments)
+        self._lists = _group_rows(assignments, self.centroids.shape[0])
@@ -0,0 +1,224 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class MetricsHook:
+    """
+    Receives the metrics of the Rebuff clients. This base class drops them; subclass it to forward them to a metrics
+    or tracing backend, e.g. StatsD, Prometheus or OpenTelemetry.
+
+    The clients report:
+        - "detect.calls", "detect.errors": detections started, and failed with an exception
+        - "detect.duration": wall-clock seconds of a whole detection
+        - "detect.stage.duration": seconds spent in each stage of a detection, tagged with the "stage" ("normalize",
+          "heuristic", "embed", "vector_query" or "llm")
+        - "check.errors": checks that raised, tagged with the "check"
+        - "cache.hits", "cache.misses": score cache lookups, tagged with the "check"
+        - "api.requests", "api.errors", "api.retries": requests to the Rebuff API, requests that failed for good, and
+          retried attempts, tagged with the "path"
+        - "api.duration": seconds of each attempt of a request to the Rebuff API, tagged with the "path"
+
+    Hooks are called from whichever thread runs the detection, so they must be thread safe.
+    """
+
+    def increment(
+        self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): Name of the counter
+            value (float): Amount to add. Defaults to 1.
+            tags (Optional[Dict[str, str]]): Dimensions of the counter. Defaults to None.
+        """
+
+    def observe(
+        self, name: str, value: float, tags: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        Records a value, e.g. a duration in seconds, in a histogram.
+
+        Args:
+            name (str): Name of the histogram
+            value (float): Value to record
+            tags (Optional[Dict[str, str]]): Dimensions of the histogram. Defaults to None.
+        """
+
+    @contextmanager
+    def timer(self, name: str, tags: Optional[Dict[str, str]] = None) -> Iterator[None]:
+        """
+        Records the wall-clock seconds spent in the `with` block, including when it raises.
+
+        Args:
+            name (str): Name of the histogram
+            tags (Optional[Dict[str, str]]): Dimensions of the histogram. Defaults to None.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, tags)
+
+
+class Histogram:
+    """
+    Counts of the recorded values per bucket, along with their count, sum, minimum and maximum.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """
+        Args:
+            buckets (Sequence[float]): Increasing upper bounds of the buckets. Values over the last one are counted
+                in an overflow bucket. Defaults to `DEFAULT_BUCKETS`.
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Args:
+            percentile (float): Percentile between 0 and 100
+
+        Returns:
+            Optional[float]: Upper bound of the bucket holding the percentile, capped by the largest value, or None if
+                no value was recorded
+        """
+        if not self.count:
+            return None
+
+        rank = percentile / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)  # type: ignore[type-var]
+        return self.max
+
+
+class InMemoryMetrics(MetricsHook):
+    """
+    Keeps counters and latency histograms in memory, e.g. for tests, debugging or a periodic export.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """
+        Args:
+            buckets (Sequence[float]): Upper bounds of the histogram buckets. Defaults to `DEFAULT_BUCKETS`.
+        """
+        self.buckets = buckets
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(
+        self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None
+    ) -> None:
+        key = _get_key(name, tags)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(
+        self, name: str, value: float, tags: Optional[Dict[str, str]] = None
+    ) -> None:
+        key = _get_key(name, tags)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def get_counter(self, name: str, tags: Optional[Dict[str, str]] = None) -> float:
+        """
+        Args:
+            name (str): Name of the counter
+            tags (Optional[Dict[str, str]]): Dimensions of the counter. Defaults to None.
+
+        Returns:
+            float: Value of the counter, 0 if it was never incremented
+        """
+        with self._lock:
+            return self._counters.get(_get_key(name, tags), 0)
+
+    def get_histogram(
+        self, name: str, tags: Optional[Dict[str, str]] = None
+    ) -> Optional[Histogram]:
+        """
+        Args:
+            name (str): Name of the histogram
+            tags (Optional[Dict[str, str]]): Dimensions of the histogram. Defaults to None.
+
+        Returns:
+            Optional[Histogram]: The histogram, or None if no value was recorded
+        """
+        with self._lock:
+            return self._histograms.get(_get_key(name, tags))
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Returns:
+            Dict[str, List[Dict[str, Any]]]: JSON serializable "counters" and "histograms", each with its name and tags
+        """
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "tags": dict(tags), "value": value}
+                    for (name, tags), value in self._counters.items()
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "tags": dict(tags),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "min": histogram.min,
+                        "max": histogram.max,
+                        "p50": histogram.percentile(50),
+                        "p95": histogram.percentile(95),
+                        "p99": histogram.percentile(99),
+                    }
+                    for (name, tags), histogram in self._histograms.items()
+                ],
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _get_key(
+    name: str, tags: Optional[Dict[str, str]]
+) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted(tags.items())) if tags else ()
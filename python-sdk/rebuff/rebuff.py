@@ -1,8 +1,26 @@
+import gzip
+import json
+import random
 import secrets
-from typing import Any, Dict, Optional, Tuple, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import TracebackType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Type, Union
 
+import httpx
 import requests
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+
+from rebuff.canary import (
+    DEFAULT_CANARY_FORMAT,
+    CanaryLeak,
+    CanaryScanner,
+    CanaryStreamMonitor,
+    MultiCanaryStreamMonitor,
+)
+from rebuff.leak_logging import BackgroundLeakLogger, LeakEvent
+from rebuff.metrics import MetricsHook
 
 
 class DetectApiRequest(BaseModel):
@@ -16,6 +34,16 @@ class DetectApiRequest(BaseModel):
     maxVectorScore: float
 
 
+class DetectBatchApiRequest(BaseModel):
+    userInputs: List[str]
+    runHeuristicCheck: bool
+    runVectorCheck: bool
+    runLanguageModelCheck: bool
+    maxHeuristicScore: float
+    maxModelScore: float
+    maxVectorScore: float
+
+
 class DetectApiSuccessResponse(BaseModel):
     heuristicScore: float
     modelScore: float
@@ -27,6 +55,8 @@ class DetectApiSuccessResponse(BaseModel):
     maxModelScore: float
     maxVectorScore: float
     injectionDetected: bool
+    # Wall-clock seconds of the stages the server reports, and of the whole request as seen by the client ("total")
+    timings: Optional[Dict[str, float]] = None
 
 
 class ApiFailureResponse(BaseModel):
@@ -34,14 +64,156 @@ class ApiFailureResponse(BaseModel):
     message: str
 
 
+# Header of the detect responses listing the request formats the server accepts besides the legacy one
+WIRE_FORMATS_HEADER = "X-Rebuff-Wire-Formats"
+WIRE_FORMAT_CHOICES = ("auto", "compact", "legacy")
+
+# Largest number of inputs the batch endpoint accepts in one request
+MAX_BATCH_SIZE = 100
+
+# Responses worth retrying: rate limiting and server errors that may be transient
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def _get_retry_delay(
+    attempt: int, backoff: float, retry_after: Optional[str] = None
+) -> float:
+    # Exponential backoff with full jitter, so that clients failing together don't retry together. The jitter only
+    # spreads retries out, it isn't security sensitive.
+    delay = random.uniform(0, min(30.0, backoff * 2**attempt))  # nosec B311
+    if retry_after is not None:
+        try:
+            delay = max(delay, min(30.0, float(retry_after)))
+        except ValueError:
+            # Retry-After can also be an HTTP date, which isn't worth parsing here
+            pass
+    return delay
+
+
 class Rebuff:
-    def __init__(self, api_token: str, api_url: str = "https://playground.rebuff.ai"):
+    def __init__(
+        self,
+        api_token: str,
+        api_url: str = "https://playground.rebuff.ai",
+        leak_logger: Optional[BackgroundLeakLogger] = None,
+        timeout: float = 30.0,
+        max_connections: int = 10,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        wire_format: str = "auto",
+        compression_threshold: Optional[int] = 4096,
+        metrics: Optional[MetricsHook] = None,
+    ):
+        """
+        Args:
+            api_token (str): Rebuff API token
+            api_url (str, optional): URL of the Rebuff API. Defaults to "https://playground.rebuff.ai".
+            leak_logger (Optional[BackgroundLeakLogger], optional): Logs leaks from a background thread, so that
+                `log_leakage` and `is_canary_word_leaked` return without waiting on the API. The client starts it,
+                and flushes it when closed. Defaults to None (leaks are logged before returning).
+            timeout (float, optional): Seconds to wait for the API to connect and to respond. Defaults to 30.0.
+            max_connections (int, optional): Maximum number of kept-alive connections to the API, which bounds the
+                concurrent requests that reuse a connection. Defaults to 10.
+            max_retries (int, optional): Number of retries of a request failing to connect or answered with a 429
+                or 5xx status. Defaults to 3.
+            backoff (float, optional): Base of the exponential backoff between retries, in seconds. Each delay is
+                drawn at random up to `backoff * 2 ** attempt`, and honors a Retry-After header. Defaults to 0.5.
+            wire_format (str, optional): Format of the detect requests. "legacy" sends the input twice, as is and
+                hex encoded, which every server accepts. "compact" sends it once and gzip compresses large requests.
+                "auto" starts with "legacy" and switches to "compact" once the server advertises it. Defaults to
+                "auto".
+            compression_threshold (Optional[int], optional): Size in bytes from which compact requests are gzip
+                compressed, None never compresses. Defaults to 4096.
+            metrics (Optional[MetricsHook], optional): Receives the call, error and retry counters and the latency of
+                each detection and request, e.g. `InMemoryMetrics()`. Defaults to None (metrics are dropped).
+        """
         self.api_token = api_token
         self.api_url = api_url
         self._headers = {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json",
         }
+        self.metrics = metrics or MetricsHook()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.wire_format = _check_wire_format(wire_format)
+        self.compression_threshold = compression_threshold
+        self._server_wire_formats: Set[str] = set()
+
+        # The session keeps connections alive, saving a TCP and TLS handshake per request
+        self._session = requests.Session()
+        self._session.headers.update(self._headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self.leak_logger = leak_logger
+        if leak_logger is not None:
+            leak_logger.start(self._write_leaks)
+
+    def close(self) -> None:
+        """
+        Writes the leaks still queued by the leak logger and closes the connections to the API.
+        """
+        if self.leak_logger is not None:
+            self.leak_logger.close()
+
+        self._session.close()
+
+    def __enter__(self) -> "Rebuff":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def _post(
+        self, path: str, data: Dict[str, Any], compact: bool = False
+    ) -> requests.Response:
+        body, headers = _encode_request_body(
+            data, self.compression_threshold if compact else None
+        )
+
+        tags = {"path": path}
+        self.metrics.increment("api.requests", tags=tags)
+
+        attempt = 0
+        while True:
+            try:
+                with self.metrics.timer("api.duration", tags):
+                    response = self._session.post(
+                        f"{self.api_url}{path}",
+                        data=body,
+                        headers=headers,
+                        timeout=self.timeout,
+                    )
+            except requests.ConnectionError:
+                if attempt == self.max_retries:
+                    self.metrics.increment("api.errors", tags=tags)
+                    raise
+                delay = _get_retry_delay(attempt, self.backoff)
+            else:
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.max_retries
+                ):
+                    if not response.ok:
+                        self.metrics.increment("api.errors", tags=tags)
+                    response.raise_for_status()
+                    return response
+                delay = _get_retry_delay(
+                    attempt, self.backoff, response.headers.get("Retry-After")
+                )
+                response.close()
+
+            self.metrics.increment("api.retries", tags=tags)
+            time.sleep(delay)
+            attempt += 1
 
     def detect_injection(
         self,
@@ -69,40 +241,181 @@ class Rebuff:
             Tuple[Union[DetectApiSuccessResponse, ApiFailureResponse], bool]: A tuple containing the detection
                 metrics and a boolean indicating if an injection was detected.
         """
-        request_data = DetectApiRequest(
-            userInput=user_input,
-            userInputBase64=encode_string(user_input),
-            runHeuristicCheck=check_heuristic,
-            runVectorCheck=check_vector,
-            runLanguageModelCheck=check_llm,
-            maxVectorScore=max_vector_score,
-            maxModelScore=max_model_score,
-            maxHeuristicScore=max_heuristic_score,
+        self.metrics.increment("detect.calls")
+        try:
+            detection = self._detect_injection(
+                user_input,
+                max_heuristic_score,
+                max_vector_score,
+                max_model_score,
+                check_heuristic,
+                check_vector,
+                check_llm,
+            )
+        except requests.RequestException:
+            self.metrics.increment("detect.errors")
+            raise
+
+        self.metrics.observe("detect.duration", detection.timings["total"])  # type: ignore[index]
+        return detection
+
+    def _detect_injection(
+        self,
+        user_input: str,
+        max_heuristic_score: float,
+        max_vector_score: float,
+        max_model_score: float,
+        check_heuristic: bool,
+        check_vector: bool,
+        check_llm: bool,
+    ) -> DetectApiSuccessResponse:
+        started = time.perf_counter()
+        compact = _use_compact_format(self.wire_format, self._server_wire_formats)
+        request_data = _build_detect_request(
+            user_input,
+            max_heuristic_score,
+            max_vector_score,
+            max_model_score,
+            check_heuristic,
+            check_vector,
+            check_llm,
+            compact,
         )
 
-        response = requests.post(
-            f"{self.api_url}/api/detect",
-            json=request_data.dict(),
-            headers=self._headers,
+        response = self._post(
+            "/api/detect", request_data.dict(exclude_none=True), compact
         )
+        self._server_wire_formats = _get_wire_formats(response.headers)
 
-        response.raise_for_status()
+        detection = _parse_detect_response(
+            response.json(), max_heuristic_score, max_vector_score, max_model_score
+        )
+        detection.timings = {
+            **(detection.timings or {}),
+            "total": time.perf_counter() - started,
+        }
+        return detection
+
+    def detect_injection_many(
+        self,
+        user_inputs: List[str],
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.9,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+        batch_size: int = MAX_BATCH_SIZE,
+        max_concurrency: int = 4,
+    ) -> List[Union[DetectApiSuccessResponse, ApiFailureResponse]]:
+        """
+        Detects injection attempts in many user inputs with the batch endpoint. The inputs are sent in batches of
+        `batch_size`, with up to `max_concurrency` batches in flight at once over the pooled connections.
+
+        Servers without the batch endpoint are sent one detect request per input instead.
+
+        Args:
+            user_inputs (List[str]): The user inputs to be checked for injection.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.9.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            batch_size (int, optional): Number of inputs per request, at most 100. Defaults to 100.
+            max_concurrency (int, optional): Maximum number of requests in flight at once. Defaults to 4.
 
-        response_json = response.json()
-        success_response = DetectApiSuccessResponse.parse_obj(response_json)
-
-        if (
-            success_response.heuristicScore > max_heuristic_score
-            or success_response.modelScore > max_model_score
-            or success_response.vectorScore["topScore"] > max_vector_score
-        ):
-            # Injection detected
-            success_response.injectionDetected = True
-            return success_response
+        Returns:
+            List[Union[DetectApiSuccessResponse, ApiFailureResponse]]: The detection metrics of each input, in the
+                order of `user_inputs`. An input that couldn't be checked, including every input of a batch whose
+                request failed, gets an `ApiFailureResponse` rather than failing the others.
+        """
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(
+                f"batch_size must be between 1 and {MAX_BATCH_SIZE}, but was {batch_size}"
+            )
+
+        def detect_batch(
+            batch: List[str],
+        ) -> List[Union[DetectApiSuccessResponse, ApiFailureResponse]]:
+            request_data = DetectBatchApiRequest(
+                userInputs=batch,
+                runHeuristicCheck=check_heuristic,
+                runVectorCheck=check_vector,
+                runLanguageModelCheck=check_llm,
+                maxVectorScore=max_vector_score,
+                maxModelScore=max_model_score,
+                maxHeuristicScore=max_heuristic_score,
+            )
+            try:
+                response = self._post(
+                    "/api/detect/batch", request_data.dict(), compact=True
+                )
+            except requests.HTTPError as error:
+                if error.response is None or error.response.status_code != 404:
+                    return _batch_failure(batch, error)
+                return [detect_one(user_input) for user_input in batch]
+            except requests.RequestException as error:
+                return _batch_failure(batch, error)
+
+            try:
+                items = response.json()["results"]
+            except (ValueError, KeyError, TypeError) as error:
+                return _batch_failure(batch, error)
+            # Results are matched to inputs by position, so a short reply mustn't shift the verdicts
+            if not isinstance(items, list) or len(items) != len(batch):
+                return _batch_failure(
+                    batch,
+                    ValueError(
+                        f"Expected {len(batch)} results in the batch response, got "
+                        f"{len(items) if isinstance(items, list) else type(items).__name__}"
+                    ),
+                )
+
+            return [
+                _parse_batch_item(
+                    item, max_heuristic_score, max_vector_score, max_model_score
+                )
+                for item in items
+            ]
+
+        def detect_one(
+            user_input: str,
+        ) -> Union[DetectApiSuccessResponse, ApiFailureResponse]:
+            try:
+                return self._detect_injection(
+                    user_input,
+                    max_heuristic_score,
+                    max_vector_score,
+                    max_model_score,
+                    check_heuristic,
+                    check_vector,
+                    check_llm,
+                )
+            except requests.RequestException as error:
+                return _batch_failure([user_input], error)[0]
+
+        self.metrics.increment("detect.calls", len(user_inputs))
+        batches = [
+            user_inputs[start : start + batch_size]
+            for start in range(0, len(user_inputs), batch_size)
+        ]
+        if len(batches) <= 1 or max_concurrency <= 1:
+            results = [detect_batch(batch) for batch in batches]
         else:
-            # No injection detected
-            success_response.injectionDetected = False
-            return success_response
+            with ThreadPoolExecutor(
+                max_workers=min(max_concurrency, len(batches))
+            ) as executor:
+                # map keeps the order of the batches whatever order they complete in
+                results = list(executor.map(detect_batch, batches))
+
+        detections = [result for batch_results in results for result in batch_results]
+        failures = sum(
+            isinstance(detection, ApiFailureResponse) for detection in detections
+        )
+        if failures:
+            self.metrics.increment("detect.errors", failures)
+        return detections
 
     @staticmethod
     def generate_canary_word(length: int = 8) -> str:
@@ -141,25 +454,7 @@ class Rebuff:
         if canary_word is None:
             canary_word = self.generate_canary_word()
 
-        # Embed the canary word in the specified format
-        canary_comment = canary_format.format(canary_word=canary_word)
-        if isinstance(prompt, str):
-            prompt_with_canary: str = canary_comment + "\n" + prompt
-            return prompt_with_canary, canary_word
-
-        try:
-            import langchain
-
-            if isinstance(prompt, langchain.PromptTemplate):
-                prompt.template = canary_comment + "\n" + prompt.template
-                return prompt, canary_word
-        except ImportError:
-            pass
-
-        raise TypeError(
-            f"prompt_template must be a PromptTemplate or a str, "
-            f"but was {type(prompt)}"
-        )
+        return _embed_canary_word(prompt, canary_word, canary_format), canary_word
 
     def is_canary_word_leaked(
         self,
@@ -186,6 +481,87 @@ class Rebuff:
             return True
         return False
 
+    def monitor_canary_word(
+        self, user_input: str, canary_word: str, log_outcome: bool = True
+    ) -> CanaryStreamMonitor:
+        """
+        Creates a monitor checking a streamed completion for the canary word, chunk by chunk.
+
+        Args:
+            user_input (str): The user input.
+            canary_word (str): The canary word to check for leakage.
+            log_outcome (bool, optional): Whether to log the leakage as soon as it is detected. The monitor doesn't
+                keep the whole completion, so the logged completion is the streamed text around the canary word.
+                Defaults to True.
+
+        Returns:
+            CanaryStreamMonitor: Monitor to feed the completion chunks to, see `CanaryStreamMonitor.feed`.
+        """
+
+        def log_leakage(monitor: CanaryStreamMonitor, text: str) -> None:
+            self.log_leakage(user_input, text, canary_word)
+
+        return CanaryStreamMonitor(canary_word, log_leakage if log_outcome else None)
+
+    def find_leaked_canary_words(
+        self,
+        user_input: str,
+        completion: str,
+        canary_words: Union[Iterable[str], Dict[str, str]],
+        canary_format: str = DEFAULT_CANARY_FORMAT,
+        log_outcome: bool = True,
+    ) -> Dict[str, CanaryLeak]:
+        """
+        Checks which of several canary words leaked in the completion, in a single pass over the completion.
+
+        Args:
+            user_input (str): The user input.
+            completion (str): The completion generated by the AI.
+            canary_words (Union[Iterable[str], Dict[str, str]]): The canary words to check for leakage, or a dict
+                from each canary word to the format it was added with.
+            canary_format (str, optional): Format of the canary words not given one. Defaults to
+                "<!-- {canary_word} -->".
+            log_outcome (bool, optional): Whether to log the leaked canary words. Defaults to True.
+
+        Returns:
+            Dict[str, CanaryLeak]: The leak of each leaked canary word, by canary word.
+        """
+        leaks = CanaryScanner(canary_words, canary_format).scan(completion)
+        if log_outcome:
+            for canary_word in leaks:
+                self.log_leakage(user_input, completion, canary_word)
+        return leaks
+
+    def monitor_canary_words(
+        self,
+        user_input: str,
+        canary_words: Union[Iterable[str], Dict[str, str]],
+        canary_format: str = DEFAULT_CANARY_FORMAT,
+        log_outcome: bool = True,
+    ) -> MultiCanaryStreamMonitor:
+        """
+        Creates a monitor checking a streamed completion for several canary words, chunk by chunk.
+
+        Args:
+            user_input (str): The user input.
+            canary_words (Union[Iterable[str], Dict[str, str]]): The canary words to check for leakage, or a dict
+                from each canary word to the format it was added with.
+            canary_format (str, optional): Format of the canary words not given one. Defaults to
+                "<!-- {canary_word} -->".
+            log_outcome (bool, optional): Whether to log each leaked canary word as soon as it is detected. The
+                monitor doesn't keep the completion, so the canary word is logged as the completion. Defaults to True.
+
+        Returns:
+            MultiCanaryStreamMonitor: Monitor to feed the completion chunks to.
+        """
+
+        def log_leakage(monitor: MultiCanaryStreamMonitor, leak: CanaryLeak) -> None:
+            self.log_leakage(user_input, leak.canary_word, leak.canary_word)
+
+        return CanaryScanner(canary_words, canary_format).monitor(
+            log_leakage if log_outcome else None
+        )
+
     def log_leakage(self, user_input: str, completion: str, canary_word: str) -> None:
         """
         Logs the leakage of a canary word.
@@ -195,17 +571,332 @@ class Rebuff:
             completion (str): The completion generated by the AI.
             canary_word (str): The leaked canary word.
         """
-        data = {
-            "user_input": user_input,
-            "completion": completion,
-            "canaryWord": canary_word,
+        event = LeakEvent(
+            user_input=user_input, completion=completion, canary_word=canary_word
+        )
+
+        if self.leak_logger is not None:
+            self.leak_logger.log(event)
+        else:
+            self._write_leaks([event])
+        return
+
+    def _write_leaks(self, events: List[LeakEvent]) -> None:
+        # The log endpoint takes one leak per request
+        for event in events:
+            data = _build_log_request(
+                event.user_input, event.completion, event.canary_word
+            )
+            self._post("/api/log", data)
+
+
+class AsyncRebuff:
+    """
+    asyncio counterpart of `Rebuff`, sharing one pooled HTTP connection to the Rebuff API across requests.
+    """
+
+    def __init__(
+        self,
+        api_token: str,
+        api_url: str = "https://playground.rebuff.ai",
+        timeout: float = 30.0,
+        max_connections: int = 100,
+        wire_format: str = "auto",
+        compression_threshold: Optional[int] = 4096,
+    ):
+        self.api_token = api_token
+        self.api_url = api_url
+        self._headers = {
+            "Authorization": f"Bearer {self.api_token}",
+            "Content-Type": "application/json",
         }
-        response = requests.post(
-            f"{self.api_url}/api/log", json=data, headers=self._headers
+        self.wire_format = _check_wire_format(wire_format)
+        self.compression_threshold = compression_threshold
+        self._server_wire_formats: Set[str] = set()
+        self._client = httpx.AsyncClient(
+            base_url=api_url,
+            headers=self._headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
         )
+
+    async def close(self) -> None:
+        """
+        Closes the connections to the Rebuff API.
+        """
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "AsyncRebuff":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def detect_injection(
+        self,
+        user_input: str,
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.9,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+    ) -> Union[DetectApiSuccessResponse, ApiFailureResponse]:
+        """
+        Detects if the given user input contains an injection attempt.
+
+        Args:
+            user_input (str): The user input to be checked for injection.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.9.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+
+        Returns:
+            Union[DetectApiSuccessResponse, ApiFailureResponse]: The detection metrics, with `injectionDetected` set
+                if an injection was detected.
+        """
+        compact = _use_compact_format(self.wire_format, self._server_wire_formats)
+        request_data = _build_detect_request(
+            user_input,
+            max_heuristic_score,
+            max_vector_score,
+            max_model_score,
+            check_heuristic,
+            check_vector,
+            check_llm,
+            compact,
+        )
+        body, headers = _encode_request_body(
+            request_data.dict(exclude_none=True),
+            self.compression_threshold if compact else None,
+        )
+
+        response = await self._client.post("/api/detect", content=body, headers=headers)
+
+        response.raise_for_status()
+        self._server_wire_formats = _get_wire_formats(response.headers)
+
+        return _parse_detect_response(
+            response.json(), max_heuristic_score, max_vector_score, max_model_score
+        )
+
+    @staticmethod
+    def generate_canary_word(length: int = 8) -> str:
+        """
+        Generates a secure random hexadecimal canary word.
+
+        Args:
+            length (int, optional): The length of the canary word. Defaults to 8.
+
+        Returns:
+            str: The generated canary word.
+        """
+        return secrets.token_hex(length // 2)
+
+    def add_canary_word(
+        self,
+        prompt: Any,
+        canary_word: Optional[str] = None,
+        canary_format: str = "<!-- {canary_word} -->",
+    ) -> Tuple[Any, str]:
+        """
+        Adds a canary word to the given prompt which we will use to detect leakage.
+
+        Args:
+            prompt (Any): The prompt to add the canary word to.
+            canary_word (Optional[str], optional): The canary word to add. If not provided, a random canary word will be
+             generated. Defaults to None.
+            canary_format (str, optional): The format in which the canary word should be added.
+            Defaults to "<!-- {canary_word} -->".
+
+        Returns:
+            Tuple[Any, str]: A tuple containing the modified prompt with the canary word and the canary word itself.
+        """
+
+        # Generate a canary word if not provided
+        if canary_word is None:
+            canary_word = self.generate_canary_word()
+
+        return _embed_canary_word(prompt, canary_word, canary_format), canary_word
+
+    async def is_canary_word_leaked(
+        self,
+        user_input: str,
+        completion: str,
+        canary_word: str,
+        log_outcome: bool = True,
+    ) -> bool:
+        """
+        Checks if the canary word is leaked in the completion.
+
+        Args:
+            user_input (str): The user input.
+            completion (str): The completion generated by the AI.
+            canary_word (str): The canary word to check for leakage.
+            log_outcome (bool, optional): Whether to log the outcome of the leakage check. Defaults to True.
+
+        Returns:
+            bool: True if the canary word is leaked, False otherwise.
+        """
+        if canary_word in completion:
+            if log_outcome:
+                await self.log_leakage(user_input, completion, canary_word)
+            return True
+        return False
+
+    async def log_leakage(
+        self, user_input: str, completion: str, canary_word: str
+    ) -> None:
+        """
+        Logs the leakage of a canary word.
+
+        Args:
+            user_input (str): The user input.
+            completion (str): The completion generated by the AI.
+            canary_word (str): The leaked canary word.
+        """
+        data = _build_log_request(user_input, completion, canary_word)
+        response = await self._client.post("/api/log", json=data)
         response.raise_for_status()
         return
 
 
+def _build_detect_request(
+    user_input: str,
+    max_heuristic_score: float,
+    max_vector_score: float,
+    max_model_score: float,
+    check_heuristic: bool,
+    check_vector: bool,
+    check_llm: bool,
+    compact: bool = False,
+) -> DetectApiRequest:
+    return DetectApiRequest(
+        userInput=user_input,
+        # Servers that don't advertise the compact format only read the hex encoded input
+        userInputBase64=None if compact else encode_string(user_input),
+        runHeuristicCheck=check_heuristic,
+        runVectorCheck=check_vector,
+        runLanguageModelCheck=check_llm,
+        maxVectorScore=max_vector_score,
+        maxModelScore=max_model_score,
+        maxHeuristicScore=max_heuristic_score,
+    )
+
+
+def _check_wire_format(wire_format: str) -> str:
+    if wire_format not in WIRE_FORMAT_CHOICES:
+        raise ValueError(
+            f"wire_format must be one of {WIRE_FORMAT_CHOICES}, but was {wire_format!r}"
+        )
+    return wire_format
+
+
+def _use_compact_format(wire_format: str, server_wire_formats: Set[str]) -> bool:
+    return wire_format == "compact" or (
+        wire_format == "auto" and "compact" in server_wire_formats
+    )
+
+
+def _get_wire_formats(headers: Mapping[str, str]) -> Set[str]:
+    return {
+        wire_format.strip()
+        for wire_format in headers.get(WIRE_FORMATS_HEADER, "").split(",")
+        if wire_format.strip()
+    }
+
+
+def _encode_request_body(
+    data: Dict[str, Any], compression_threshold: Optional[int] = None
+) -> Tuple[bytes, Dict[str, str]]:
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    if compression_threshold is None or len(body) < compression_threshold:
+        return body, {}
+
+    # The fastest level already gets most of the size reduction on text
+    return gzip.compress(body, compresslevel=1), {"Content-Encoding": "gzip"}
+
+
+def _parse_detect_response(
+    response_json: Any,
+    max_heuristic_score: float,
+    max_vector_score: float,
+    max_model_score: float,
+) -> DetectApiSuccessResponse:
+    success_response = DetectApiSuccessResponse.parse_obj(response_json)
+
+    if (
+        success_response.heuristicScore > max_heuristic_score
+        or success_response.modelScore > max_model_score
+        or success_response.vectorScore["topScore"] > max_vector_score
+    ):
+        # Injection detected
+        success_response.injectionDetected = True
+        return success_response
+    else:
+        # No injection detected
+        success_response.injectionDetected = False
+        return success_response
+
+
+def _parse_batch_item(
+    item: Dict[str, Any],
+    max_heuristic_score: float,
+    max_vector_score: float,
+    max_model_score: float,
+) -> Union[DetectApiSuccessResponse, ApiFailureResponse]:
+    if "error" in item:
+        return ApiFailureResponse.parse_obj(item)
+    return _parse_detect_response(
+        item, max_heuristic_score, max_vector_score, max_model_score
+    )
+
+
+def _batch_failure(
+    batch: List[str], error: Exception
+) -> List[Union[DetectApiSuccessResponse, ApiFailureResponse]]:
+    failure = ApiFailureResponse(error="request_failed", message=str(error))
+    return [failure.copy() for _ in batch]
+
+
+def _build_log_request(
+    user_input: str, completion: str, canary_word: str
+) -> Dict[str, str]:
+    return {
+        "user_input": user_input,
+        "completion": completion,
+        "canaryWord": canary_word,
+    }
+
+
+def _embed_canary_word(prompt: Any, canary_word: str, canary_format: str) -> Any:
+    # Embed the canary word in the specified format
+    canary_comment = canary_format.format(canary_word=canary_word)
+    if isinstance(prompt, str):
+        prompt_with_canary: str = canary_comment + "\n" + prompt
+        return prompt_with_canary
+
+    try:
+        import langchain
+
+        if isinstance(prompt, langchain.PromptTemplate):
+            prompt.template = canary_comment + "\n" + prompt.template
+            return prompt
+    except ImportError:
+        pass
+
+    raise TypeError(
+        f"prompt_template must be a PromptTemplate or a str, " f"but was {type(prompt)}"
+    )
+
+
 def encode_string(message: str) -> str:
     return message.encode("utf-8").hex()
@@ -1,15 +1,65 @@
+import asyncio
+import functools
 import secrets
-from typing import Optional, Tuple, Union
+import threading
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from types import TracebackType
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import PromptTemplate
+from langchain_core.vectorstores import VectorStore
+from openai import AsyncOpenAI, OpenAI
 from pydantic import BaseModel
 
-from rebuff.detect_pi_heuristics import detect_prompt_injection_using_heuristic_on_input
+from rebuff.cache import CacheBackend, get_cache_key
+from rebuff.canary import (
+    DEFAULT_CANARY_FORMAT,
+    CanaryLeak,
+    CanaryScanner,
+    CanaryStreamMonitor,
+    MultiCanaryStreamMonitor,
+)
+from rebuff.detect_pi_heuristics import (
+    detect_prompt_injection_using_heuristic_on_input,
+    detect_prompt_injection_using_heuristic_on_inputs,
+    get_heuristic_index,
+)
 from rebuff.detect_pi_openai import (
+    acall_openai_to_detect_pi,
     call_openai_to_detect_pi,
+    create_async_openai_client,
+    create_openai_client,
     render_prompt_for_pi_detection,
 )
-from rebuff.detect_pi_vectorbase import detect_pi_using_vector_database, init_pinecone
+from rebuff.detect_pi_vectorbase import (
+    adetect_pi_using_vector_database,
+    close_pinecone,
+    detect_pi_using_vector_database,
+    detect_pi_using_vector_database_many,
+    init_pinecone,
+)
+from rebuff.embeddings import EmbeddingCache
+from rebuff.heuristic_executor import HeuristicExecutor
+from rebuff.leak_logging import BackgroundLeakLogger, LeakEvent
+from rebuff.metrics import MetricsHook
 
 
 class RebuffDetectionResponse(BaseModel):
@@ -23,6 +73,121 @@ class RebuffDetectionResponse(BaseModel):
     max_model_score: float
     max_vector_score: float
     injection_detected: bool
+    checks_run: List[str] = []
+    checks_skipped: List[str] = []
+    # Wall-clock seconds of each stage that ran ("normalize", "heuristic", "embed", "vector_query", "llm") and of the
+    # whole detection ("total")
+    timings: Optional[Dict[str, float]] = None
+
+
+def _get_decisive_score_check(
+    max_heuristic_score: float, max_vector_score: float, max_model_score: float
+) -> Callable[[str, float], bool]:
+    max_scores = {
+        "heuristic": max_heuristic_score,
+        "vector": max_vector_score,
+        "llm": max_model_score,
+    }
+
+    def is_decisive(name: str, score: float) -> bool:
+        # Any score over its maximum detects the injection, whatever the other checks return
+        return score > max_scores[name]
+
+    return is_decisive
+
+
+def _build_detection_response(
+    scores: Dict[str, float],
+    checks: List[str],
+    max_heuristic_score: float,
+    max_vector_score: float,
+    max_model_score: float,
+    timings: Optional[Dict[str, float]] = None,
+) -> RebuffDetectionResponse:
+    injection_detected = False
+
+    rebuff_heuristic_score = scores.get("heuristic", 0)
+    rebuff_vector_score = scores.get("vector", 0)
+    rebuff_model_score = scores.get("llm", 0)
+
+    if (
+        rebuff_heuristic_score > max_heuristic_score
+        or rebuff_model_score > max_model_score
+        or rebuff_vector_score > max_vector_score
+    ):
+        injection_detected = True
+
+    rebuff_response = RebuffDetectionResponse(
+        heuristic_score=rebuff_heuristic_score,
+        openai_score=rebuff_model_score,
+        vector_score=rebuff_vector_score,
+        run_heuristic_check="heuristic" in checks,
+        run_language_model_check="llm" in checks,
+        run_vector_check="vector" in checks,
+        max_heuristic_score=max_heuristic_score,
+        max_model_score=max_model_score,
+        max_vector_score=max_vector_score,
+        injection_detected=injection_detected,
+        checks_run=[name for name in checks if name in scores],
+        checks_skipped=[name for name in checks if name not in scores],
+        timings=timings,
+    )
+    return rebuff_response
+
+
+def _embed_canary_word(
+    prompt: Union[str, PromptTemplate], canary_word: str, canary_format: str
+) -> Union[str, PromptTemplate]:
+    # Embed the canary word in the specified format
+    canary_comment = canary_format.format(canary_word=canary_word)
+
+    if isinstance(prompt, str):
+        prompt_with_canary: str = canary_comment + "\n" + prompt
+        return prompt_with_canary
+
+    elif isinstance(prompt, PromptTemplate):
+        prompt.template = canary_comment + "\n" + prompt.template
+        return prompt
+
+    else:
+        raise TypeError(
+            f"prompt must be a langchain_core.prompts.PromptTemplate or a str, "
+            f"but was {type(prompt)}"
+        )
+
+
+def _get_vector_variant(
+    pinecone_index: str,
+    vector_store: Optional[VectorStore],
+    embeddings: Optional[Embeddings],
+    cache_namespace: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Identifies the vector store and embeddings a vector score was computed with, for the score cache keys.
+
+    Args:
+        pinecone_index (str): Pinecone index name, used when there is no custom vector store
+        vector_store (Optional[VectorStore]): Custom vector store, if any
+        embeddings (Optional[Embeddings]): Embeddings of the Pinecone index, if not the default ones
+        cache_namespace (Optional[str]): Identifies the contents of the custom vector store. Defaults to None.
+
+    Returns:
+        Optional[str]: None if the custom vector store can't be identified, so its scores mustn't be cached
+    """
+    if vector_store is not None:
+        # A store saved to disk holds the same vectors in every process. Nothing identifies the contents of others,
+        # as object ids are reused once a store is freed and mean nothing to other processes sharing the cache.
+        store_id = cache_namespace or getattr(vector_store, "path", None)
+        if store_id is None:
+            return None
+        embeddings = vector_store.embeddings
+        store = f"{type(vector_store).__name__}:{store_id}"
+    else:
+        store = f"pinecone:{pinecone_index}"
+
+    if embeddings is None:
+        return f"{store}:text-embedding-ada-002"
+    return f"{store}:{getattr(embeddings, 'model', type(embeddings).__name__)}"
 
 
 class RebuffSdk:
@@ -32,19 +197,135 @@ class RebuffSdk:
         pinecone_apikey: str,
         pinecone_index: str,
         openai_model: str = "gpt-3.5-turbo",
+        openai_client: Optional[OpenAI] = None,
+        max_workers: Optional[int] = None,
+        cache: Optional[CacheBackend] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        vector_store: Optional[VectorStore] = None,
+        embeddings: Optional[Embeddings] = None,
+        leak_logger: Optional[BackgroundLeakLogger] = None,
+        metrics: Optional[MetricsHook] = None,
+        heuristic_max_work: Optional[int] = None,
+        heuristic_executor: Optional[HeuristicExecutor] = None,
+        cache_namespace: Optional[str] = None,
     ) -> None:
+        """
+        Args:
+            openai_apikey (str): Open AI API key
+            pinecone_apikey (str): Pinecone API key
+            pinecone_index (str): Pinecone index name
+            openai_model (str, optional): Model used for the language model check. Defaults to "gpt-3.5-turbo".
+            openai_client (Optional[OpenAI], optional): Client used for the language model check, e.g. one created
+                with `create_openai_client` to tune its connection pool. The SDK creates and closes its own client
+                if not provided.
+            max_workers (Optional[int], optional): Size of the thread pool used to run checks concurrently. Defaults
+                to the `concurrent.futures.ThreadPoolExecutor` default.
+            cache (Optional[CacheBackend], optional): Cache for the score of each check, keyed on the normalized user
+                input, e.g. `InMemoryCache()`. Thresholds are applied after the lookup, so cached scores are reused
+                whatever the maximum scores of a call. Defaults to None (no caching).
+            embedding_cache (Optional[EmbeddingCache], optional): Cache looked up before embedding a text for the
+                vector check or for logging a leak, e.g. `EmbeddingCache(path="embeddings")` to keep the embeddings
+                across restarts. Defaults to None (no caching).
+            vector_store (Optional[VectorStore], optional): Vector store used for the vector check and for logging
+                leaks instead of Pinecone, e.g. a `NumpyVectorStore`. The Pinecone settings are then unused and the
+                caller keeps ownership of the store. Defaults to None (Pinecone).
+            embeddings (Optional[Embeddings], optional): Embeddings of the Pinecone index, e.g. `HashingEmbeddings()`
+                to embed locally. The index must have been filled with the same embeddings. A `vector_store` brings
+                its own embeddings. Defaults to the Open AI "text-embedding-ada-002" embeddings.
+            leak_logger (Optional[BackgroundLeakLogger], optional): Logs leaks from a background thread in batches,
+                so that `log_leakage` and `is_canary_word_leaked` return without waiting on the vector store. The SDK
+                starts it, and flushes it when closed. Defaults to None (leaks are logged before returning).
+            metrics (Optional[MetricsHook], optional): Receives the call, error and cache counters and the latency of
+                each detection and of its stages, e.g. `InMemoryMetrics()`. Defaults to None (metrics are dropped).
+            heuristic_max_work (Optional[int], optional): Budget of the heuristic check on long inputs, in candidate
+                windows, after which the rest of the input isn't scored. See
+                `detect_prompt_injection_using_heuristic_on_input`. Defaults to None (no budget).
+            heuristic_executor (Optional[HeuristicExecutor], optional): Process pool the heuristic check runs in, so
+                that checks from concurrent threads run in parallel. The caller keeps ownership of the executor.
+                Defaults to None, which runs the check in the calling thread.
+            cache_namespace (Optional[str], optional): Identifies the contents of a `vector_store` kept in memory in
+                the `cache` keys, e.g. the name and version of its attack corpus. Vector scores are only cached for
+                Pinecone, for stores saved to a path and for stores with a namespace. Defaults to None.
+        """
         self.openai_model = openai_model
         self.openai_apikey = openai_apikey
         self.pinecone_apikey = pinecone_apikey
         self.pinecone_index = pinecone_index
-        self.vector_store = None
+        self.vector_store = vector_store
+        self._owns_vector_store = vector_store is None
+        self.heuristic_index = get_heuristic_index()
+        self.heuristic_max_work = heuristic_max_work
+        self.heuristic_executor = heuristic_executor
+        self._vector_store_lock = threading.Lock()
+        self._owns_openai_client = openai_client is None
+        self.openai_client = openai_client or create_openai_client(openai_apikey)
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self.cache = cache
+        self.cache_namespace = cache_namespace
+        self.embedding_cache = embedding_cache
+        self.embeddings = embeddings
+        self.leak_logger = leak_logger
+        if leak_logger is not None:
+            leak_logger.start(self._write_leaks)
+        self.metrics = metrics or MetricsHook()
 
     def initialize_pinecone(self) -> None:
-        self.vector_store = init_pinecone(
-            self.pinecone_apikey,
-            self.pinecone_index,
-            self.openai_apikey,
-        )
+        """
+        Connects to the Pinecone vector store on first use. Later calls reuse the same client and connections.
+        """
+        if self.vector_store is not None:
+            return
+
+        with self._vector_store_lock:
+            if self.vector_store is None:
+                self.vector_store = init_pinecone(
+                    self.pinecone_apikey,
+                    self.pinecone_index,
+                    self.openai_apikey,
+                    embedding_cache=self.embedding_cache,
+                    embeddings=self.embeddings,
+                )
+
+    def _get_vector_store(self) -> VectorStore:
+        self.initialize_pinecone()
+
+        vector_store = self.vector_store
+        if vector_store is None:
+            raise RuntimeError("RebuffSdk was closed during the call")
+        return vector_store
+
+    def close(self) -> None:
+        """
+        Releases the connections held by the SDK, after writing the leaks still queued.
+        """
+        if self.leak_logger is not None:
+            self.leak_logger.close()
+
+        with self._vector_store_lock:
+            if self._owns_vector_store and self.vector_store is not None:
+                close_pinecone(self.vector_store)
+                self.vector_store = None
+
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+        if self._owns_openai_client:
+            self.openai_client.close()
+
+    def __enter__(self) -> "RebuffSdk":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
 
     def detect_injection(
         self,
@@ -55,6 +336,9 @@ class RebuffSdk:
         check_heuristic: bool = True,
         check_vector: bool = True,
         check_llm: bool = True,
+        run_concurrently: bool = False,
+        check_timeout: Optional[float] = None,
+        short_circuit: bool = False,
     ) -> RebuffDetectionResponse:
         """
         Detects if the given user input contains an injection attempt.
@@ -67,63 +351,451 @@ class RebuffSdk:
             check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
             check_vector (bool, optional): Whether to run the vector check. Defaults to True.
             check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            run_concurrently (bool, optional): Whether to run the vector and language model checks concurrently with
+                each other and with the heuristic check. Defaults to False.
+            check_timeout (Optional[float], optional): Seconds to wait for the vector and language model checks when
+                running concurrently before raising a TimeoutError. Defaults to None (no timeout).
+            short_circuit (bool, optional): Whether to run the checks from cheapest to most expensive (heuristic,
+                vector, language model) and skip the remaining ones as soon as a score exceeds its maximum, since the
+                injection is detected at that point. Defaults to False.
 
         Returns:
-            RebuffDetectionResponse
+            RebuffDetectionResponse: The scores, with the duration of each stage in `timings`
         """
+        self.metrics.increment("detect.calls")
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
 
-        injection_detected = False
-
+        checks: Dict[str, Callable[[], float]] = {}
         if check_heuristic:
-            rebuff_heuristic_score = detect_prompt_injection_using_heuristic_on_input(
-                user_input
+            checks["heuristic"] = lambda: self._heuristic_check(user_input, timings)
+        if check_vector:
+            checks["vector"] = lambda: self._vector_check(
+                user_input, max_vector_score, timings
             )
+        if check_llm:
+            checks["llm"] = lambda: self._language_model_check(user_input, timings)
 
-        else:
-            rebuff_heuristic_score = 0
+        checks = {
+            name: self._counted_check(name, self._cached_check(name, user_input, check))
+            for name, check in checks.items()
+        }
 
-        if check_vector:
-            self.initialize_pinecone()
+        is_decisive = _get_decisive_score_check(
+            max_heuristic_score, max_vector_score, max_model_score
+        )
 
-            vector_score = detect_pi_using_vector_database(
-                user_input, max_vector_score, self.vector_store
+        try:
+            scores = self._run_checks(
+                checks,
+                run_concurrently,
+                check_timeout,
+                is_decisive=is_decisive if short_circuit else None,
             )
-            rebuff_vector_score = vector_score["top_score"]
+        except Exception:
+            self.metrics.increment("detect.errors")
+            raise
 
-        else:
-            rebuff_vector_score = 0
+        # Copied, as checks cut short by a decisive score may still be running and recording their timings
+        timings = dict(timings, total=time.perf_counter() - started)
+        for stage, seconds in timings.items():
+            if stage != "total":
+                self.metrics.observe("detect.stage.duration", seconds, {"stage": stage})
+        self.metrics.observe("detect.duration", timings["total"])
+
+        return _build_detection_response(
+            scores,
+            list(checks),
+            max_heuristic_score,
+            max_vector_score,
+            max_model_score,
+            timings,
+        )
+
+    def detect_injection_many(
+        self,
+        user_inputs: List[str],
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.90,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+        short_circuit: bool = False,
+        embedding_batch_size: int = 500,
+        heuristic_processes: Optional[int] = None,
+    ) -> List[RebuffDetectionResponse]:
+        """
+        Detects injection attempts in many user inputs at once.
+
+        Inputs are embedded in batches for the vector check, and the vector and language model requests are sent
+        concurrently on the SDK's thread pool.
+
+        Args:
+            user_inputs (List[str]): The user inputs to be checked for injection.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.90.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            short_circuit (bool, optional): Whether to skip the remaining checks of an input as soon as one of its
+                scores exceeds its maximum. Defaults to False.
+            embedding_batch_size (int, optional): Number of inputs embedded per embedding request. Defaults to 500.
+            heuristic_processes (Optional[int], optional): Number of worker processes to start for this call to run
+                the heuristic check in, when the SDK has no `heuristic_executor`. Defaults to None, which runs it in
+                the calling thread, scoring all the inputs at once unless the SDK has a `heuristic_max_work`.
+
+        Returns:
+            List[RebuffDetectionResponse]: One response per user input, in input order. The checks run on whole
+                batches, so the responses have no `timings`.
+        """
+        self.metrics.increment("detect.calls", len(user_inputs))
+        try:
+            return self._detect_injection_many(
+                user_inputs,
+                max_heuristic_score,
+                max_vector_score,
+                max_model_score,
+                check_heuristic,
+                check_vector,
+                check_llm,
+                short_circuit,
+                embedding_batch_size,
+                heuristic_processes,
+            )
+        except Exception:
+            self.metrics.increment("detect.errors", len(user_inputs))
+            raise
+
+    def _detect_injection_many(
+        self,
+        user_inputs: List[str],
+        max_heuristic_score: float,
+        max_vector_score: float,
+        max_model_score: float,
+        check_heuristic: bool,
+        check_vector: bool,
+        check_llm: bool,
+        short_circuit: bool,
+        embedding_batch_size: int,
+        heuristic_processes: Optional[int],
+    ) -> List[RebuffDetectionResponse]:
+        checks = [
+            name
+            for name, enabled in (
+                ("heuristic", check_heuristic),
+                ("vector", check_vector),
+                ("llm", check_llm),
+            )
+            if enabled
+        ]
+        is_decisive = _get_decisive_score_check(
+            max_heuristic_score, max_vector_score, max_model_score
+        )
+        scores: List[Dict[str, float]] = [{} for _ in user_inputs]
+
+        def undecided() -> List[int]:
+            return [
+                i
+                for i, input_scores in enumerate(scores)
+                if not short_circuit
+                or not any(
+                    is_decisive(name, score) for name, score in input_scores.items()
+                )
+            ]
+
+        def run_heuristic_checks(inputs: List[str]) -> Iterable[float]:
+            if self.heuristic_executor is not None:
+                return self.heuristic_executor.map(
+                    inputs,
+                    self.heuristic_max_work,
+                    chunksize=max(
+                        len(inputs) // (self.heuristic_executor.processes * 4), 1
+                    ),
+                )
+
+            if heuristic_processes is None:
+                if self.heuristic_max_work is not None:
+                    return map(self._heuristic_check, inputs)
+                # Without a budget, the inputs are scored together with array operations
+                return detect_prompt_injection_using_heuristic_on_inputs(
+                    inputs, self.heuristic_index
+                )
+
+            with ProcessPoolExecutor(max_workers=heuristic_processes) as pool:
+                # Each worker builds its own keyword index on first use
+                return list(
+                    pool.map(
+                        functools.partial(
+                            detect_prompt_injection_using_heuristic_on_input,
+                            max_work=self.heuristic_max_work,
+                        ),
+                        inputs,
+                        chunksize=max(len(inputs) // (heuristic_processes * 4), 1),
+                    )
+                )
+
+        def run_vector_checks(inputs: List[str]) -> Iterable[float]:
+            vector_scores = detect_pi_using_vector_database_many(
+                inputs,
+                max_vector_score,
+                self._get_vector_store(),
+                batch_size=embedding_batch_size,
+                executor=self._get_executor(),
+            )
+            return [vector_score["top_score"] for vector_score in vector_scores]
+
+        def run_language_model_checks(inputs: List[str]) -> Iterable[float]:
+            return self._get_executor().map(self._language_model_check, inputs)
+
+        if check_heuristic:
+            self._run_check_many(
+                "heuristic", undecided(), user_inputs, scores, run_heuristic_checks
+            )
+
+        if check_vector:
+            self._run_check_many(
+                "vector", undecided(), user_inputs, scores, run_vector_checks
+            )
 
         if check_llm:
-            rendered_input = render_prompt_for_pi_detection(user_input)
-            model_response = call_openai_to_detect_pi(
-                rendered_input, self.openai_model, self.openai_apikey
+            self._run_check_many(
+                "llm", undecided(), user_inputs, scores, run_language_model_checks
             )
 
-            rebuff_model_score = float(model_response.get("completion", 0))
+        return [
+            _build_detection_response(
+                input_scores,
+                checks,
+                max_heuristic_score,
+                max_vector_score,
+                max_model_score,
+            )
+            for input_scores in scores
+        ]
 
-        else:
-            rebuff_model_score = 0
-
-        if (
-            rebuff_heuristic_score > max_heuristic_score
-            or rebuff_model_score > max_model_score
-            or rebuff_vector_score > max_vector_score
-        ):
-            injection_detected = True
-
-        rebuff_response = RebuffDetectionResponse(
-            heuristic_score=rebuff_heuristic_score,
-            openai_score=rebuff_model_score,
-            vector_score=rebuff_vector_score,
-            run_heuristic_check=check_heuristic,
-            run_language_model_check=check_llm,
-            run_vector_check=check_vector,
-            max_heuristic_score=max_heuristic_score,
-            max_model_score=max_model_score,
-            max_vector_score=max_vector_score,
-            injection_detected=injection_detected,
-        )
-        return rebuff_response
+    def _run_check_many(
+        self,
+        name: str,
+        indices: List[int],
+        user_inputs: List[str],
+        scores: List[Dict[str, float]],
+        run: Callable[[List[str]], Iterable[float]],
+    ) -> None:
+        """
+        Runs a check on the given inputs, taking cached scores from the cache when possible.
+
+        Args:
+            name (str): Name of the check
+            indices (List[int]): Indices of the inputs to check
+            user_inputs (List[str]): All the user inputs
+            scores (List[Dict[str, float]]): Scores of each input by check name, updated in place
+            run (Callable[[List[str]], Iterable[float]]): Computes the scores of a list of inputs, in order
+        """
+        cache_keys: Dict[int, str] = {}
+        missing = indices
+
+        cache = self.cache
+        variant = None if cache is None else self._get_cache_variant(name)
+        if cache is not None and variant is not None:
+            missing = []
+            for i in indices:
+                cache_keys[i] = get_cache_key(name, user_inputs[i], variant)
+                score = cache.get(cache_keys[i])
+                if score is None:
+                    missing.append(i)
+                else:
+                    scores[i][name] = score
+            self._count_cache_lookups(name, len(indices) - len(missing), len(missing))
+
+        for i, score in zip(missing, run([user_inputs[i] for i in missing])):
+            scores[i][name] = score
+            if cache is not None and variant is not None:
+                cache.set(cache_keys[i], score)
+
+    def _get_cache_variant(self, name: str) -> Optional[str]:
+        # The scores also depend on the heuristic budget, the vector store and embeddings, and the model they were
+        # computed with. None if the scores of the check mustn't be cached.
+        if name == "heuristic":
+            return (
+                ""
+                if self.heuristic_max_work is None
+                else f"max_work={self.heuristic_max_work}"
+            )
+        if name == "vector":
+            return _get_vector_variant(
+                self.pinecone_index,
+                None if self._owns_vector_store else self.vector_store,
+                self.embeddings,
+                self.cache_namespace,
+            )
+        return self.openai_model
+
+    def _cached_check(
+        self, name: str, user_input: str, check: Callable[[], float]
+    ) -> Callable[[], float]:
+        cache = self.cache
+        variant = None if cache is None else self._get_cache_variant(name)
+        if cache is None or variant is None:
+            return check
+
+        cache_key = get_cache_key(name, user_input, variant)
+
+        def cached_check() -> float:
+            score = cache.get(cache_key)
+            self._count_cache_lookups(name, score is not None, score is None)
+            if score is None:
+                score = check()
+                cache.set(cache_key, score)
+            return score
+
+        return cached_check
+
+    def _counted_check(
+        self, name: str, check: Callable[[], float]
+    ) -> Callable[[], float]:
+        def counted_check() -> float:
+            try:
+                return check()
+            except Exception:
+                self.metrics.increment("check.errors", tags={"check": name})
+                raise
+
+        return counted_check
+
+    def _count_cache_lookups(self, name: str, hits: int, misses: int) -> None:
+        if hits:
+            self.metrics.increment("cache.hits", hits, {"check": name})
+        if misses:
+            self.metrics.increment("cache.misses", misses, {"check": name})
+
+    def _heuristic_check(
+        self, user_input: str, timings: Optional[Dict[str, float]] = None
+    ) -> float:
+        if self.heuristic_executor is not None:
+            started = time.perf_counter()
+            score = self.heuristic_executor.submit(
+                user_input, self.heuristic_max_work
+            ).result()
+            # The worker normalizes and scores the input, so both count as the heuristic stage
+            if timings is not None:
+                timings["heuristic"] = time.perf_counter() - started
+            return score
+
+        return detect_prompt_injection_using_heuristic_on_input(
+            user_input, self.heuristic_index, timings, max_work=self.heuristic_max_work
+        )
+
+    def _vector_check(
+        self,
+        user_input: str,
+        max_vector_score: float,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> float:
+        vector_score = detect_pi_using_vector_database(
+            user_input, max_vector_score, self._get_vector_store(), timings
+        )
+        return vector_score["top_score"]
+
+    def _language_model_check(
+        self, user_input: str, timings: Optional[Dict[str, float]] = None
+    ) -> float:
+        started = time.perf_counter()
+        rendered_input = render_prompt_for_pi_detection(user_input)
+        model_response = call_openai_to_detect_pi(
+            rendered_input,
+            self.openai_model,
+            self.openai_apikey,
+            client=self.openai_client,
+        )
+
+        if timings is not None:
+            timings["llm"] = time.perf_counter() - started
+        return float(model_response.get("completion", 0))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="rebuff-check",
+                    )
+
+        return self._executor
+
+    def _run_checks(
+        self,
+        checks: Dict[str, Callable[[], float]],
+        run_concurrently: bool,
+        check_timeout: Optional[float],
+        is_decisive: Optional[Callable[[str, float], bool]] = None,
+    ) -> Dict[str, float]:
+        """
+        Runs the given checks and collects their scores by check name.
+
+        Args:
+            checks (Dict[str, Callable[[], float]]): Checks to run by name, cheapest first
+            run_concurrently (bool): Whether to run the network bound checks on the SDK's thread pool
+            check_timeout (Optional[float]): Seconds to wait for concurrent checks before raising a TimeoutError
+            is_decisive (Optional[Callable[[str, float], bool]]): Tells whether the score of a check settles the
+                outcome. If given, no further checks are run once a decisive score is found.
+
+        Returns:
+            Dict[str, float]: Score of each check that ran
+        """
+        scores: Dict[str, float] = {}
+
+        def decided(name: str) -> bool:
+            return is_decisive is not None and is_decisive(name, scores[name])
+
+        if not run_concurrently:
+            for name, check in checks.items():
+                scores[name] = check()
+                if decided(name):
+                    break
+            return scores
+
+        heuristic_check = checks.get("heuristic")
+        network_checks = {
+            name: check for name, check in checks.items() if name != "heuristic"
+        }
+
+        # When short-circuiting, the paid checks only start if the heuristic couldn't settle the outcome
+        if is_decisive is not None and heuristic_check is not None:
+            scores["heuristic"] = heuristic_check()
+            if decided("heuristic"):
+                return scores
+            heuristic_check = None
+
+        deadline = None if check_timeout is None else time.monotonic() + check_timeout
+        futures = {
+            self._get_executor().submit(check): name
+            for name, check in network_checks.items()
+        }
+
+        try:
+            # The heuristic is CPU bound, so it runs on the calling thread while the network checks are in flight
+            if heuristic_check is not None:
+                scores["heuristic"] = heuristic_check()
+
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            for future in as_completed(futures, timeout=timeout):
+                name = futures[future]
+                scores[name] = future.result()
+                if decided(name):
+                    break
+        except FutureTimeoutError:
+            pending = [name for name in futures.values() if name not in scores]
+            raise TimeoutError(
+                f"{', '.join(pending)} check did not finish within {check_timeout} seconds"
+            ) from None
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return scores
 
     @staticmethod
     def generate_canary_word(length: int = 8) -> str:
@@ -160,22 +832,7 @@ class RebuffSdk:
         if canary_word is None:
             canary_word = self.generate_canary_word()
 
-        # Embed the canary word in the specified format
-        canary_comment = canary_format.format(canary_word=canary_word)
-
-        if isinstance(prompt, str):
-            prompt_with_canary: str = canary_comment + "\n" + prompt
-            return prompt_with_canary, canary_word
-
-        elif isinstance(prompt, PromptTemplate):
-            prompt.template = canary_comment + "\n" + prompt.template
-            return prompt, canary_word
-
-        else:
-            raise TypeError(
-                f"prompt must be a langchain_core.prompts.PromptTemplate or a str, "
-                f"but was {type(prompt)}"
-            )
+        return _embed_canary_word(prompt, canary_word, canary_format), canary_word
 
     def is_canary_word_leaked(
         self,
@@ -202,6 +859,87 @@ class RebuffSdk:
             return True
         return False
 
+    def monitor_canary_word(
+        self, user_input: str, canary_word: str, log_outcome: bool = True
+    ) -> CanaryStreamMonitor:
+        """
+        Creates a monitor checking a streamed completion for the canary word, chunk by chunk.
+
+        Args:
+            user_input (str): The user input.
+            canary_word (str): The canary word to check for leakage.
+            log_outcome (bool, optional): Whether to log the leakage as soon as it is detected. The monitor doesn't
+                keep the whole completion, so the logged completion is the streamed text around the canary word.
+                Defaults to True.
+
+        Returns:
+            CanaryStreamMonitor: Monitor to feed the completion chunks to, see `CanaryStreamMonitor.feed`.
+        """
+
+        def log_leakage(monitor: CanaryStreamMonitor, text: str) -> None:
+            self.log_leakage(user_input, text, canary_word)
+
+        return CanaryStreamMonitor(canary_word, log_leakage if log_outcome else None)
+
+    def find_leaked_canary_words(
+        self,
+        user_input: str,
+        completion: str,
+        canary_words: Union[Iterable[str], Dict[str, str]],
+        canary_format: str = DEFAULT_CANARY_FORMAT,
+        log_outcome: bool = True,
+    ) -> Dict[str, CanaryLeak]:
+        """
+        Checks which of several canary words leaked in the completion, in a single pass over the completion.
+
+        Args:
+            user_input (str): The user input.
+            completion (str): The completion generated by the AI.
+            canary_words (Union[Iterable[str], Dict[str, str]]): The canary words to check for leakage, or a dict
+                from each canary word to the format it was added with.
+            canary_format (str, optional): Format of the canary words not given one. Defaults to
+                "<!-- {canary_word} -->".
+            log_outcome (bool, optional): Whether to log the leaked canary words. Defaults to True.
+
+        Returns:
+            Dict[str, CanaryLeak]: The leak of each leaked canary word, by canary word.
+        """
+        leaks = CanaryScanner(canary_words, canary_format).scan(completion)
+        if log_outcome:
+            for canary_word in leaks:
+                self.log_leakage(user_input, completion, canary_word)
+        return leaks
+
+    def monitor_canary_words(
+        self,
+        user_input: str,
+        canary_words: Union[Iterable[str], Dict[str, str]],
+        canary_format: str = DEFAULT_CANARY_FORMAT,
+        log_outcome: bool = True,
+    ) -> MultiCanaryStreamMonitor:
+        """
+        Creates a monitor checking a streamed completion for several canary words, chunk by chunk.
+
+        Args:
+            user_input (str): The user input.
+            canary_words (Union[Iterable[str], Dict[str, str]]): The canary words to check for leakage, or a dict
+                from each canary word to the format it was added with.
+            canary_format (str, optional): Format of the canary words not given one. Defaults to
+                "<!-- {canary_word} -->".
+            log_outcome (bool, optional): Whether to log each leaked canary word as soon as it is detected. The
+                monitor doesn't keep the completion, so the canary word is logged as the completion. Defaults to True.
+
+        Returns:
+            MultiCanaryStreamMonitor: Monitor to feed the completion chunks to.
+        """
+
+        def log_leakage(monitor: MultiCanaryStreamMonitor, leak: CanaryLeak) -> None:
+            self.log_leakage(user_input, leak.canary_word, leak.canary_word)
+
+        return CanaryScanner(canary_words, canary_format).monitor(
+            log_leakage if log_outcome else None
+        )
+
     def log_leakage(self, user_input: str, completion: str, canary_word: str) -> None:
         """
         Logs the leakage of a canary word.
@@ -211,11 +949,357 @@ class RebuffSdk:
             completion (str): The completion generated by the AI.
             canary_word (str): The leaked canary word.
         """
+        event = LeakEvent(
+            user_input=user_input, completion=completion, canary_word=canary_word
+        )
+
+        if self.leak_logger is not None:
+            self.leak_logger.log(event)
+        else:
+            self._write_leaks([event])
+
+        return None
+
+    def _write_leaks(self, events: List[LeakEvent]) -> None:
+        self._get_vector_store().add_texts(
+            [event.user_input for event in events],
+            metadatas=[
+                {"completion": event.completion, "canary_word": event.canary_word}
+                for event in events
+            ],
+        )
+
+
+class AsyncRebuffSdk:
+    """
+    asyncio counterpart of `RebuffSdk`. Network calls don't block the event loop and the CPU bound heuristic check
+    runs in an executor.
+    """
+
+    def __init__(
+        self,
+        openai_apikey: str,
+        pinecone_apikey: str,
+        pinecone_index: str,
+        openai_model: str = "gpt-3.5-turbo",
+        openai_client: Optional[AsyncOpenAI] = None,
+        heuristic_executor: Optional[Union[Executor, HeuristicExecutor]] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        vector_store: Optional[VectorStore] = None,
+        embeddings: Optional[Embeddings] = None,
+    ) -> None:
+        """
+        Args:
+            openai_apikey (str): Open AI API key
+            pinecone_apikey (str): Pinecone API key
+            pinecone_index (str): Pinecone index name
+            openai_model (str, optional): Model used for the language model check. Defaults to "gpt-3.5-turbo".
+            openai_client (Optional[AsyncOpenAI], optional): Client used for the language model check, e.g. one
+                created with `create_async_openai_client`. The SDK creates and closes its own client if not provided.
+            heuristic_executor (Optional[Union[Executor, HeuristicExecutor]], optional): Executor the heuristic
+                check runs in, e.g. a `HeuristicExecutor` to run it in parallel with other checks. Defaults to the
+                event loop's default executor.
+            embedding_cache (Optional[EmbeddingCache], optional): Cache looked up before embedding a text for the
+                vector check or for logging a leak. Defaults to None (no caching).
+            vector_store (Optional[VectorStore], optional): Vector store used instead of Pinecone, see `RebuffSdk`.
+                Defaults to None (Pinecone).
+            embeddings (Optional[Embeddings], optional): Embeddings of the Pinecone index, see `RebuffSdk`. Defaults
+                to the Open AI "text-embedding-ada-002" embeddings.
+        """
+        self.openai_model = openai_model
+        self.openai_apikey = openai_apikey
+        self.pinecone_apikey = pinecone_apikey
+        self.pinecone_index = pinecone_index
+        self.vector_store = vector_store
+        self._owns_vector_store = vector_store is None
+        self.heuristic_index = get_heuristic_index()
+        self.heuristic_executor = heuristic_executor
+        self.embedding_cache = embedding_cache
+        self.embeddings = embeddings
+        self._vector_store_lock: Optional[asyncio.Lock] = None
+        self._owns_openai_client = openai_client is None
+        self.openai_client = openai_client or create_async_openai_client(openai_apikey)
+
+    async def initialize_pinecone(self) -> None:
+        """
+        Connects to the Pinecone vector store on first use. Later calls reuse the same client and connections.
+        """
+        if self.vector_store is not None:
+            return
+
+        if self._vector_store_lock is None:
+            self._vector_store_lock = asyncio.Lock()
+
+        async with self._vector_store_lock:
+            if self.vector_store is None:
+                loop = asyncio.get_running_loop()
+                self.vector_store = await loop.run_in_executor(
+                    None,
+                    functools.partial(
+                        init_pinecone,
+                        self.pinecone_apikey,
+                        self.pinecone_index,
+                        self.openai_apikey,
+                        embedding_cache=self.embedding_cache,
+                        embeddings=self.embeddings,
+                    ),
+                )
+
+    async def _get_vector_store(self) -> VectorStore:
+        await self.initialize_pinecone()
+
+        vector_store = self.vector_store
+        if vector_store is None:
+            raise RuntimeError("AsyncRebuffSdk was closed during the call")
+        return vector_store
+
+    async def close(self) -> None:
+        """
+        Releases the connections held by the SDK.
+        """
+        if self._owns_vector_store and self.vector_store is not None:
+            close_pinecone(self.vector_store)
+            self.vector_store = None
+
+        if self._owns_openai_client:
+            await self.openai_client.close()
+
+    async def __aenter__(self) -> "AsyncRebuffSdk":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def detect_injection(
+        self,
+        user_input: str,
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.90,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+        check_timeout: Optional[float] = None,
+        short_circuit: bool = False,
+    ) -> RebuffDetectionResponse:
+        """
+        Detects if the given user input contains an injection attempt. The checks run concurrently.
+
+        Args:
+            user_input (str): The user input to be checked for injection.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.90.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            check_timeout (Optional[float], optional): Seconds to wait for the checks before raising a TimeoutError.
+                Defaults to None (no timeout).
+            short_circuit (bool, optional): Whether to run the heuristic check before the others and skip the
+                remaining checks as soon as a score exceeds its maximum. Defaults to False.
+
+        Returns:
+            RebuffDetectionResponse
+        """
+
+        checks: Dict[str, Callable[[], Awaitable[float]]] = {}
+        if check_heuristic:
+            checks["heuristic"] = lambda: self._heuristic_check(user_input)
+        if check_vector:
+            checks["vector"] = lambda: self._vector_check(user_input, max_vector_score)
+        if check_llm:
+            checks["llm"] = lambda: self._language_model_check(user_input)
+
+        is_decisive = _get_decisive_score_check(
+            max_heuristic_score, max_vector_score, max_model_score
+        )
+
+        scores = await self._run_checks(
+            checks, check_timeout, is_decisive=is_decisive if short_circuit else None
+        )
+
+        return _build_detection_response(
+            scores,
+            list(checks),
+            max_heuristic_score,
+            max_vector_score,
+            max_model_score,
+        )
+
+    async def _heuristic_check(self, user_input: str) -> float:
+        if isinstance(self.heuristic_executor, HeuristicExecutor):
+            return await asyncio.wrap_future(self.heuristic_executor.submit(user_input))
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.heuristic_executor,
+            detect_prompt_injection_using_heuristic_on_input,
+            user_input,
+            self.heuristic_index,
+        )
+
+    async def _vector_check(self, user_input: str, max_vector_score: float) -> float:
+        vector_score = await adetect_pi_using_vector_database(
+            user_input, max_vector_score, await self._get_vector_store()
+        )
+        return vector_score["top_score"]
+
+    async def _language_model_check(self, user_input: str) -> float:
+        rendered_input = render_prompt_for_pi_detection(user_input)
+        model_response = await acall_openai_to_detect_pi(
+            rendered_input, self.openai_model, self.openai_client
+        )
+
+        return float(model_response.get("completion", 0))
+
+    async def _run_checks(
+        self,
+        checks: Dict[str, Callable[[], Awaitable[float]]],
+        check_timeout: Optional[float],
+        is_decisive: Optional[Callable[[str, float], bool]] = None,
+    ) -> Dict[str, float]:
+        """
+        Runs the given checks concurrently and collects their scores by check name.
+
+        Args:
+            checks (Dict[str, Callable[[], Awaitable[float]]]): Checks to run by name, cheapest first
+            check_timeout (Optional[float]): Seconds to wait for the checks before raising a TimeoutError
+            is_decisive (Optional[Callable[[str, float], bool]]): Tells whether the score of a check settles the
+                outcome. If given, the heuristic runs first and no further checks are awaited once a decisive score
+                is found.
+
+        Returns:
+            Dict[str, float]: Score of each check that ran
+        """
+        scores: Dict[str, float] = {}
+        deadline = None if check_timeout is None else time.monotonic() + check_timeout
+
+        # When short-circuiting, the paid checks only start if the heuristic couldn't settle the outcome
+        if is_decisive is not None and "heuristic" in checks:
+            try:
+                scores["heuristic"] = await asyncio.wait_for(
+                    checks["heuristic"](), timeout=check_timeout
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"heuristic check did not finish within {check_timeout} seconds"
+                ) from None
+            if is_decisive("heuristic", scores["heuristic"]):
+                return scores
+
+        tasks = {
+            asyncio.ensure_future(check()): name
+            for name, check in checks.items()
+            if name not in scores
+        }
+
+        try:
+            pending = set(tasks)
+            while pending:
+                timeout = (
+                    None if deadline is None else max(deadline - time.monotonic(), 0)
+                )
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise TimeoutError(
+                        f"{', '.join(tasks[task] for task in pending)} check did not finish within "
+                        f"{check_timeout} seconds"
+                    )
+
+                for task in done:
+                    name = tasks[task]
+                    scores[name] = task.result()
+                    if is_decisive is not None and is_decisive(name, scores[name]):
+                        return scores
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return scores
+
+    @staticmethod
+    def generate_canary_word(length: int = 8) -> str:
+        """
+        Generates a secure random hexadecimal canary word.
+
+        Args:
+            length (int, optional): The length of the canary word. Defaults to 8.
+
+        Returns:
+            str: The generated canary word.
+        """
+        return secrets.token_hex(length // 2)
+
+    def add_canary_word(
+        self,
+        prompt: Union[str, PromptTemplate],
+        canary_word: Optional[str] = None,
+        canary_format: str = "<!-- {canary_word} -->",
+    ) -> Tuple[Union[str, PromptTemplate], str]:
+        """
+        Adds a canary word to the given prompt which we will use to detect leakage.
 
-        if self.vector_store is None:
-            self.initialize_pinecone()
+        Args:
+            prompt (Union[str, PromptTemplate]): The prompt to add the canary word to.
+            canary_word (Optional[str], optional): The canary word to add. If not provided, a random canary word will be generated. Defaults to None.
+            canary_format (str, optional): The format in which the canary word should be added. Defaults to "<!-- {canary_word} -->".
+
+        Returns:
+            Tuple[Union[str, PromptTemplate], str]: A tuple containing the modified prompt with the canary word and the canary word itself.
+        """
+
+        # Generate a canary word if not provided
+        if canary_word is None:
+            canary_word = self.generate_canary_word()
+
+        return _embed_canary_word(prompt, canary_word, canary_format), canary_word
+
+    async def is_canary_word_leaked(
+        self,
+        user_input: str,
+        completion: str,
+        canary_word: str,
+        log_outcome: bool = True,
+    ) -> bool:
+        """
+        Checks if the canary word is leaked in the completion.
+
+        Args:
+            user_input (str): The user input.
+            completion (str): The completion generated by the AI.
+            canary_word (str): The canary word to check for leakage.
+            log_outcome (bool, optional): Whether to log the outcome of the leakage check. Defaults to True.
+
+        Returns:
+            bool: True if the canary word is leaked, False otherwise.
+        """
+        if canary_word in completion:
+            if log_outcome:
+                await self.log_leakage(user_input, completion, canary_word)
+            return True
+        return False
+
+    async def log_leakage(
+        self, user_input: str, completion: str, canary_word: str
+    ) -> None:
+        """
+        Logs the leakage of a canary word.
+
+        Args:
+            user_input (str): The user input.
+            completion (str): The completion generated by the AI.
+            canary_word (str): The leaked canary word.
+        """
 
-        self.vector_store.add_texts(
+        vector_store = await self._get_vector_store()
+        await vector_store.aadd_texts(
             [user_input],
             metadatas=[{"completion": completion, "canary_word": canary_word}],
         )
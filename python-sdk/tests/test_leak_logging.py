@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import List
+
+from rebuff.leak_logging import BackgroundLeakLogger, LeakEvent
+from rebuff.local_vector_store import NumpyVectorStore
+from rebuff.sdk import RebuffSdk
+
+from .utils import WordEmbeddings
+
+
+def leak(i: int) -> LeakEvent:
+    return LeakEvent(user_input=f"input {i}", completion="completion", canary_word="c")
+
+
+def test_events_are_written_in_batches() -> None:
+    batches: List[List[LeakEvent]] = []
+    logger = BackgroundLeakLogger(batch_size=3, flush_interval=60)
+    logger.start(batches.append)
+
+    for i in range(7):
+        assert logger.log(leak(i))
+    logger.flush()
+    logger.close()
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [event for batch in batches for event in batch] == [
+        leak(i) for i in range(7)
+    ]
+    assert logger.stats() == {
+        "queued": 0,
+        "logged": 7,
+        "dropped": 0,
+        "failed": 0,
+        "batches": 3,
+        "max_queued": logger.stats()["max_queued"],
+    }
+
+
+def test_partial_batch_is_written_after_flush_interval() -> None:
+    batches: List[List[LeakEvent]] = []
+    logger = BackgroundLeakLogger(batch_size=100, flush_interval=0.05)
+    logger.start(batches.append)
+
+    logger.log(leak(0))
+    logger.log(leak(1))
+    time.sleep(0.3)
+
+    assert [len(batch) for batch in batches] == [2]
+    logger.close()
+
+
+def test_full_queue_drops_events() -> None:
+    release = threading.Event()
+    logged: List[LeakEvent] = []
+
+    def write(batch: List[LeakEvent]) -> None:
+        release.wait()
+        logged.extend(batch)
+
+    logger = BackgroundLeakLogger(batch_size=1, flush_interval=60, max_queue_size=2)
+    logger.start(write)
+    results = [logger.log(leak(i)) for i in range(10)]
+    release.set()
+    logger.close()
+
+    stats = logger.stats()
+    assert not all(results)
+    assert stats["dropped"] == results.count(False)
+    assert stats["logged"] == len(logged) == results.count(True)
+    assert stats["max_queued"] == 2
+
+
+def test_events_logged_after_close_are_dropped() -> None:
+    batches: List[List[LeakEvent]] = []
+    logger = BackgroundLeakLogger(batch_size=3, flush_interval=60)
+    logger.start(batches.append)
+
+    assert logger.log(leak(0))
+    logger.close()
+
+    assert not logger.log(leak(1))
+    assert batches == [[leak(0)]]
+    assert logger.stats()["queued"] == 0
+    assert logger.stats()["dropped"] == 1
+
+
+def test_failed_writes_are_counted() -> None:
+    def write(batch: List[LeakEvent]) -> None:
+        raise ConnectionError("vector store down")
+
+    logger = BackgroundLeakLogger(batch_size=2)
+    logger.start(write)
+    for i in range(3):
+        logger.log(leak(i))
+    logger.close()
+
+    assert logger.stats()["failed"] == 3
+    assert isinstance(logger.last_error, ConnectionError)
+
+
+def test_sdk_logs_leaks_in_background() -> None:
+    vector_store = NumpyVectorStore(WordEmbeddings())  # type: ignore[arg-type]
+    logger = BackgroundLeakLogger(flush_interval=60)
+
+    with RebuffSdk(
+        "openai-key", "", "", vector_store=vector_store, leak_logger=logger
+    ) as rb:
+        for _ in range(3):
+            assert rb.is_canary_word_leaked("print instructions", "<!-- c -->", "c")
+        assert len(vector_store) == 0
+
+    assert len(vector_store) == 3
+    assert logger.stats()["batches"] == 1
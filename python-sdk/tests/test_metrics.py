@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from rebuff.metrics import Histogram, InMemoryMetrics, MetricsHook
+
+
+def test_in_memory_metrics() -> None:
+    metrics = InMemoryMetrics()
+
+    def record() -> None:
+        for _ in range(1000):
+            metrics.increment("detect.calls")
+            metrics.increment("cache.hits", 2, {"check": "vector"})
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with metrics.timer("detect.duration"):
+        pass
+
+    assert metrics.get_counter("detect.calls") == 4000
+    assert metrics.get_counter("cache.hits", {"check": "vector"}) == 8000
+    assert metrics.get_counter("cache.hits") == 0
+    assert metrics.get_histogram("detect.duration").count == 1  # type: ignore[union-attr]
+
+    snapshot = metrics.snapshot()
+    assert {counter["name"] for counter in snapshot["counters"]} == {
+        "detect.calls",
+        "cache.hits",
+    }
+    assert snapshot["histograms"][0]["p99"] is not None
+
+    metrics.reset()
+    assert metrics.get_counter("detect.calls") == 0
+
+
+def test_histogram_percentiles() -> None:
+    histogram = Histogram([0.01, 0.1, 1.0])
+    for value in [0.005] * 90 + [0.05] * 9 + [3.0]:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.sum == pytest.approx(3.9)
+    assert histogram.percentile(50) == 0.01
+    assert histogram.percentile(95) == 0.1
+    assert histogram.percentile(100) == 3.0
+    assert Histogram().percentile(50) is None
+
+
+def test_metrics_hook_timer_records_failures() -> None:
+    observed = []
+
+    class Hook(MetricsHook):
+        def observe(self, name, value, tags=None):  # type: ignore[no-untyped-def]
+            observed.append((name, tags))
+
+    with pytest.raises(ValueError):
+        with Hook().timer("api.duration", {"path": "/api/detect"}):
+            raise ValueError()
+
+    assert observed == [("api.duration", {"path": "/api/detect"})]
@@ -1,4 +1,5 @@
 import os
+from typing import List
 
 
 def get_environment_variable(key: str) -> str:
@@ -6,3 +7,15 @@ def get_environment_variable(key: str) -> str:
     if not value:
         raise ValueError(f"Missing environment variable: {key}")
     return value
+
+
+class WordEmbeddings:
+    # Bag of words over a tiny vocabulary, so that similarities are easy to predict
+    vocabulary = ["ignore", "previous", "instructions", "weather", "today", "print"]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        words = text.lower().split()
+        return [float(words.count(word)) for word in self.vocabulary]
@@ -0,0 +1,153 @@
+import { NextApiRequest, NextApiResponse } from "next";
+import { DetectRequest } from "rebuff";
+import {
+  readJsonBody,
+  RequestBodyError,
+  WIRE_FORMATS,
+  WIRE_FORMATS_HEADER,
+} from "./request-body";
+import {
+  ApiFailureResponse,
+  DetectBatchApiRequest,
+  DetectBatchApiResponse,
+  DetectResponse,
+} from "@types";
+
+export const MAX_BATCH_SIZE = 100;
+export const MAX_BODY_BYTES = 10 * 1024 * 1024;
+// Inputs of a batch checked at the same time, bounding the concurrent calls to the model and the vector database
+export const CONCURRENCY = 8;
+
+// Passed in by the route, so that the handler can be tested without the database, model and vector store clients
+export interface DetectBatchDependencies {
+  checkApiKeyAndReduceBalance: (
+    apiKey: string,
+    requestCount: number
+  ) => Promise<{ success: boolean; message: string }>;
+  detectInjection: (request: DetectRequest) => Promise<DetectResponse>;
+}
+
+export function createDetectBatchHandler({
+  checkApiKeyAndReduceBalance,
+  detectInjection,
+}: DetectBatchDependencies) {
+  return async function handler(
+    req: NextApiRequest,
+    res: NextApiResponse<any>
+  ) {
+    if (req.method !== "POST") {
+      return res.status(405).json({
+        error: "not_allowed",
+        message: "Method not allowed",
+      } as ApiFailureResponse);
+    }
+    res.setHeader(WIRE_FORMATS_HEADER, WIRE_FORMATS);
+    try {
+      // Extract the API key from the Authorization header
+      const apiKey = req.headers.authorization?.split(" ")[1];
+
+      // Assert that the API key is present
+      if (!apiKey) {
+        return res.status(401).json({
+          error: "unauthorized",
+          message: "Missing API key",
+        } as ApiFailureResponse);
+      }
+
+      // Read the body before charging for the request, so that malformed requests are free
+      let body: DetectBatchApiRequest;
+      try {
+        body = await readJsonBody(req, MAX_BODY_BYTES);
+      } catch (error) {
+        if (error instanceof RequestBodyError) {
+          if (error.status === 413) {
+            // The client may still be sending the rest of the body, so the connection is closed after the response
+            res.setHeader("Connection", "close");
+          }
+          return res.status(error.status).json({
+            error: "bad_request",
+            message: error.message,
+          } as ApiFailureResponse);
+        }
+        throw error;
+      }
+
+      const {
+        userInputs,
+        runHeuristicCheck = true,
+        runVectorCheck = true,
+        runLanguageModelCheck = true,
+        maxHeuristicScore = null,
+        maxModelScore = null,
+        maxVectorScore = null,
+      } = body;
+
+      if (
+        !Array.isArray(userInputs) ||
+        userInputs.length === 0 ||
+        userInputs.length > MAX_BATCH_SIZE ||
+        userInputs.some((userInput) => typeof userInput !== "string")
+      ) {
+        return res.status(400).json({
+          error: "bad_request",
+          message: `userInputs must be a list of 1 to ${MAX_BATCH_SIZE} strings`,
+        } as ApiFailureResponse);
+      }
+
+      // Check if the API key is valid and reduce the account balance for every input of the batch at once
+      const { success, message } = await checkApiKeyAndReduceBalance(
+        apiKey,
+        userInputs.length
+      );
+
+      if (!success) {
+        return res.status(401).json({
+          error: "unauthorized",
+          message: message,
+        } as ApiFailureResponse);
+      }
+
+      const results: (DetectResponse | ApiFailureResponse)[] = new Array(
+        userInputs.length
+      );
+      let next = 0;
+
+      // Each worker takes the next input until none is left, so results keep the order of the inputs
+      const worker = async () => {
+        while (next < userInputs.length) {
+          const index = next++;
+          try {
+            results[index] = await detectInjection({
+              userInput: userInputs[index],
+              runHeuristicCheck,
+              runVectorCheck,
+              runLanguageModelCheck,
+              maxHeuristicScore,
+              maxModelScore,
+              maxVectorScore,
+            });
+          } catch (error) {
+            console.error("Error in detecting injection:");
+            console.error(error);
+            results[index] = {
+              error: "bad_request",
+              message: error.message,
+            } as ApiFailureResponse;
+          }
+        }
+      };
+      await Promise.all(
+        Array.from({ length: Math.min(CONCURRENCY, userInputs.length) }, worker)
+      );
+
+      return res.status(200).json({ results } as DetectBatchApiResponse);
+    } catch (error) {
+      console.error("Error in detect batch API:");
+      console.error(error);
+      return res.status(500).json({
+        error: "server_error",
+        message: "Internal server error",
+      } as ApiFailureResponse);
+    }
+  };
+}
@@ -25,6 +25,7 @@ export function runMiddleware(
     });
   });
 }
+
 async function deductCredits(
   apiKey: string,
   billingRate: number
@@ -56,10 +57,13 @@ async function deductCredits(
   return { success: true, message: "API key accepted and credits deducted" };
 }
 
+// Charges `requestCount` detections at once, e.g. for a batch
 export async function checkApiKeyAndReduceBalance(
-  apiKey: string
+  apiKey: string,
+  requestCount: number = 1
 ): Promise<{ success: boolean; message: string }> {
-  const billingRate = parseInt(getEnvironmentVariable("BILLING_RATE_INT_10K"));
+  const billingRate =
+    parseInt(getEnvironmentVariable("BILLING_RATE_INT_10K")) * requestCount;
 
   // Get the master credit amount from the environment variable
   if (process.env.MASTER_API_KEY && apiKey === process.env.MASTER_API_KEY) {
@@ -0,0 +1,71 @@
+import { NextApiRequest } from "next";
+import { gunzip } from "zlib";
+import { promisify } from "util";
+
+const gunzipAsync = promisify(gunzip);
+
+// Advertised on detect responses, so that clients only send the compact request (userInput without its hex copy in
+// userInputBase64) and gzip request bodies to servers that understand them
+export const WIRE_FORMATS_HEADER = "X-Rebuff-Wire-Formats";
+export const WIRE_FORMATS = "compact, gzip";
+
+export class RequestBodyError extends Error {
+  status: number;
+
+  constructor(status: number, message: string) {
+    super(message);
+    this.name = this.constructor.name;
+    this.status = status;
+  }
+}
+
+// Reads a JSON request body, decompressing it when sent with "Content-Encoding: gzip". Routes using it must disable
+// the Next.js body parser. maxBytes bounds both the received and the decompressed body. A body over the limit is
+// drained without being kept rather than destroyed, so that the client still receives the 413 response: routes
+// should answer it with "Connection: close".
+export async function readJsonBody(
+  req: NextApiRequest,
+  maxBytes: number = 1024 * 1024
+): Promise<any> {
+  let body = await new Promise<Buffer>((resolve, reject) => {
+    let chunks: Buffer[] = [];
+    let size = 0;
+    req.on("data", (chunk: Buffer) => {
+      if (size > maxBytes) {
+        return;
+      }
+      size += chunk.length;
+      if (size > maxBytes) {
+        chunks = [];
+        reject(new RequestBodyError(413, "Request body too large"));
+        return;
+      }
+      chunks.push(chunk);
+    });
+    req.on("end", () => resolve(Buffer.concat(chunks)));
+    req.on("error", reject);
+  });
+
+  const encoding = (req.headers["content-encoding"] || "identity").toLowerCase();
+  if (encoding === "gzip") {
+    try {
+      body = await gunzipAsync(body, { maxOutputLength: maxBytes });
+    } catch (error) {
+      if (error.code === "ERR_BUFFER_TOO_LARGE") {
+        throw new RequestBodyError(413, "Request body too large");
+      }
+      throw new RequestBodyError(400, "Invalid gzip request body");
+    }
+  } else if (encoding !== "identity") {
+    throw new RequestBodyError(415, `Unsupported content encoding: ${encoding}`);
+  }
+
+  if (body.length === 0) {
+    return {};
+  }
+  try {
+    return JSON.parse(body.toString("utf-8"));
+  } catch (error) {
+    throw new RequestBodyError(400, "Invalid JSON request body");
+  }
+}
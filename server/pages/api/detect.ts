@@ -5,12 +5,25 @@ import {
   runMiddleware,
   checkApiKeyAndReduceBalance,
 } from "@/lib/detect-helpers";
+import {
+  readJsonBody,
+  RequestBodyError,
+  WIRE_FORMATS,
+  WIRE_FORMATS_HEADER,
+} from "@/lib/request-body";
 import { ApiFailureResponse } from "@types";
 
 const cors = Cors({
   methods: ["POST"],
 });
 
+// The body is read by readJsonBody, which also accepts gzip compressed bodies
+export const config = {
+  api: {
+    bodyParser: false,
+  },
+};
+
 export default async function handler(
   req: NextApiRequest,
   res: NextApiResponse<any>
@@ -22,6 +35,7 @@ export default async function handler(
       message: "Method not allowed",
     } as ApiFailureResponse);
   }
+  res.setHeader(WIRE_FORMATS_HEADER, WIRE_FORMATS);
   try {
     // Extract the API key from the Authorization header
     const apiKey = req.headers.authorization?.split(" ")[1];
@@ -34,6 +48,24 @@ export default async function handler(
       } as ApiFailureResponse);
     }
 
+    // Read the body before charging for the request, so that malformed requests are free
+    let body;
+    try {
+      body = await readJsonBody(req);
+    } catch (error) {
+      if (error instanceof RequestBodyError) {
+        if (error.status === 413) {
+          // The client may still be sending the rest of the body, so the connection is closed after the response
+          res.setHeader("Connection", "close");
+        }
+        return res.status(error.status).json({
+          error: "bad_request",
+          message: error.message,
+        } as ApiFailureResponse);
+      }
+      throw error;
+    }
+
     // Check if the API key is valid and reduce the account balance
     const { success, message } = await checkApiKeyAndReduceBalance(apiKey);
 
@@ -44,18 +76,21 @@ export default async function handler(
       } as ApiFailureResponse);
     }
 
+    // Compact requests only send userInput, legacy requests also send its hex encoding in userInputBase64, which
+    // takes precedence
     const {
-      userInputBase64,
+      userInput = "",
+      userInputBase64 = "",
       runHeuristicCheck = true,
       runVectorCheck = true,
       runLanguageModelCheck = true,
       maxHeuristicScore = null,
       maxModelScore = null,
       maxVectorScore = null,
-    } = req.body;
+    } = body;
     try {
       const resp = await rebuff.detectInjection({
-        userInput: "",
+        userInput,
         userInputBase64,
         runHeuristicCheck,
         runVectorCheck,
@@ -0,0 +1,34 @@
+import { NextApiRequest, NextApiResponse } from "next";
+import Cors from "cors";
+import { rebuff } from "@/lib/rebuff";
+import {
+  runMiddleware,
+  checkApiKeyAndReduceBalance,
+} from "@/lib/detect-helpers";
+import { createDetectBatchHandler } from "@/lib/detect-batch";
+import { DetectResponse } from "@types";
+
+const cors = Cors({
+  methods: ["POST"],
+});
+
+// The body is read by readJsonBody, which also accepts gzip compressed bodies
+export const config = {
+  api: {
+    bodyParser: false,
+  },
+};
+
+const detectBatch = createDetectBatchHandler({
+  checkApiKeyAndReduceBalance,
+  detectInjection: async (request) =>
+    (await rebuff.detectInjection(request)) as DetectResponse,
+});
+
+export default async function handler(
+  req: NextApiRequest,
+  res: NextApiResponse<any>
+) {
+  await runMiddleware(req, res, cors);
+  return detectBatch(req, res);
+}
@@ -0,0 +1,202 @@
+import { Readable } from "stream";
+import { gzipSync } from "zlib";
+import { describe, it } from "mocha";
+import { expect } from "chai";
+import { NextApiRequest, NextApiResponse } from "next";
+import {
+  CONCURRENCY,
+  createDetectBatchHandler,
+  MAX_BATCH_SIZE,
+  MAX_BODY_BYTES,
+} from "../lib/detect-batch";
+
+interface FakeResponse {
+  statusCode?: number;
+  body?: any;
+  headers: Record<string, string>;
+}
+
+function request(
+  body: Buffer | object,
+  headers: Record<string, string> = { authorization: "Bearer key" }
+): NextApiRequest {
+  const data = Buffer.isBuffer(body) ? body : Buffer.from(JSON.stringify(body));
+  // Sent in chunks, as a socket would
+  const chunks = [];
+  for (let start = 0; start < data.length; start += 64 * 1024) {
+    chunks.push(data.subarray(start, start + 64 * 1024));
+  }
+  const req = Readable.from(chunks) as any;
+  req.method = "POST";
+  req.headers = headers;
+  return req as NextApiRequest;
+}
+
+function response(): [NextApiResponse, FakeResponse] {
+  const result: FakeResponse = { headers: {} };
+  const res = {
+    status(code: number) {
+      result.statusCode = code;
+      return res;
+    },
+    json(body: any) {
+      result.body = body;
+      return res;
+    },
+    setHeader(name: string, value: string) {
+      result.headers[name.toLowerCase()] = value;
+      return res;
+    },
+  };
+  return [res as any, result];
+}
+
+function detection(userInput: string): any {
+  return { heuristicScore: userInput.length, injectionDetected: false };
+}
+
+function sleep(ms: number): Promise<void> {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+function handlerWith(
+  detectInjection: (request: any) => Promise<any> = async (request) =>
+    detection(request.userInput)
+) {
+  const charges: number[] = [];
+  const detected: string[] = [];
+  const handler = createDetectBatchHandler({
+    checkApiKeyAndReduceBalance: async (apiKey, requestCount) => {
+      charges.push(requestCount);
+      return apiKey === "key"
+        ? { success: true, message: "API key accepted" }
+        : { success: false, message: "Invalid API key" };
+    },
+    detectInjection: async (request) => {
+      detected.push(request.userInput);
+      return detectInjection(request);
+    },
+  });
+  return { handler, charges, detected };
+}
+
+describe("POST /api/detect/batch", () => {
+  it("rejects requests without an API key", async () => {
+    const { handler, charges } = handlerWith();
+    const [res, result] = response();
+
+    await handler(request({ userInputs: ["a"] }, {}), res);
+
+    expect(result.statusCode).to.equal(401);
+    expect(charges).to.deep.equal([]);
+  });
+
+  it("rejects batches over the input limit without charging", async () => {
+    const { handler, charges, detected } = handlerWith();
+    const userInputs = Array.from(
+      { length: MAX_BATCH_SIZE + 1 },
+      (_, i) => `input ${i}`
+    );
+
+    for (const body of [
+      { userInputs },
+      { userInputs: [] },
+      { userInputs: [1] },
+    ]) {
+      const [res, result] = response();
+      await handler(request(body), res);
+      expect(result.statusCode).to.equal(400);
+      expect(result.body.error).to.equal("bad_request");
+    }
+    expect(charges).to.deep.equal([]);
+    expect(detected).to.deep.equal([]);
+  });
+
+  it("answers bodies over the size limit with a 413", async () => {
+    const { handler, charges } = handlerWith();
+    const userInputs = ["x".repeat(MAX_BODY_BYTES)];
+    const [res, result] = response();
+
+    await handler(request({ userInputs }), res);
+
+    expect(result.statusCode).to.equal(413);
+    expect(result.body.message).to.equal("Request body too large");
+    expect(result.headers["connection"]).to.equal("close");
+    expect(charges).to.deep.equal([]);
+  });
+
+  it("bounds decompressed bodies by the size limit", async () => {
+    const { handler } = handlerWith();
+    const userInputs = ["x".repeat(MAX_BODY_BYTES)];
+    const [res, result] = response();
+
+    await handler(
+      request(gzipSync(JSON.stringify({ userInputs })), {
+        authorization: "Bearer key",
+        "content-encoding": "gzip",
+      }),
+      res
+    );
+
+    expect(result.statusCode).to.equal(413);
+  });
+
+  it("charges the balance once for every input of the batch", async () => {
+    const { handler, charges } = handlerWith();
+    const [res, result] = response();
+
+    await handler(request({ userInputs: ["a", "b", "c"] }), res);
+
+    expect(result.statusCode).to.equal(200);
+    expect(charges).to.deep.equal([3]);
+  });
+
+  it("doesn't check inputs when the balance can't be charged", async () => {
+    const { handler, charges, detected } = handlerWith();
+    const [res, result] = response();
+
+    await handler(
+      request({ userInputs: ["a", "b"] }, { authorization: "Bearer other" }),
+      res
+    );
+
+    expect(result.statusCode).to.equal(401);
+    expect(result.body.message).to.equal("Invalid API key");
+    expect(charges).to.deep.equal([2]);
+    expect(detected).to.deep.equal([]);
+  });
+
+  it("returns results in the order of the inputs", async () => {
+    let running = 0;
+    let maxRunning = 0;
+    const { handler } = handlerWith(async ({ userInput }) => {
+      running++;
+      maxRunning = Math.max(maxRunning, running);
+      // Later inputs finish first
+      await sleep(50 - userInput.length);
+      running--;
+      if (userInput === "x".repeat(7)) {
+        throw new Error("Detection failed");
+      }
+      return detection(userInput);
+    });
+    const userInputs = Array.from({ length: 30 }, (_, i) => "x".repeat(i + 1));
+    const [res, result] = response();
+
+    await handler(request({ userInputs }), res);
+
+    expect(result.statusCode).to.equal(200);
+    expect(result.body.results).to.have.length(30);
+    result.body.results.forEach((item: any, i: number) => {
+      if (i === 6) {
+        expect(item).to.deep.equal({
+          error: "bad_request",
+          message: "Detection failed",
+        });
+      } else {
+        expect(item.heuristicScore).to.equal(i + 1);
+      }
+    });
+    expect(maxRunning).to.equal(CONCURRENCY);
+  });
+});
@@ -34,6 +34,21 @@ export interface DetectResponse {
   injectionDetected: boolean;
 }
 
+export interface DetectBatchApiRequest {
+  userInputs: string[];
+  runHeuristicCheck?: boolean;
+  runVectorCheck?: boolean;
+  runLanguageModelCheck?: boolean;
+  maxHeuristicScore?: number;
+  maxVectorScore?: number;
+  maxModelScore?: number;
+}
+
+export interface DetectBatchApiResponse {
+  // In the order of the inputs, with a failure for each input that couldn't be checked
+  results: (DetectResponse | ApiFailureResponse)[];
+}
+
 interface PlaygroundStats {
   breaches: {
     total: number;